@@ -0,0 +1,72 @@
+"""Compare the node-to-node payload encodings on typical tournament traffic.
+
+Usage: python benchmarks/codec_benchmark.py [players]
+"""
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from chord import codec  # noqa: E402
+
+
+def tournament(players: int) -> dict:
+    code = base64.b64encode(b"import random\ndef play():\n    return random.choice(['rock', 'paper', 'scissor'])\n")
+    return {
+        'type': 'elimination',
+        'players': [{'name': f'player{i}', 'score': i % 7, 'code': code.decode(), 'active': True,
+                     'next_round': False} for i in range(players)],
+        'results': [[1, f'player{i}', f'player{i + 1}', False] for i in range(0, players, 2)],
+        'winner': None,
+        'completed': False,
+        'round': 1,
+        'temp': players // 2,
+    }
+
+
+def delta(items: int) -> dict:
+    return {'epoch': 'a1b2c3d4', 'seq': 1000 + items, 'full': False,
+            'items': {f'tournament{i}': [1000 + i, {'completed': False, 'round': i}] for i in range(items)},
+            'deleted': [[f'old{i}', 900 + i] for i in range(items // 4)]}
+
+
+# How STORE_KEY payloads were built before the codecs: a JSON string inside a text frame
+class LegacyText:
+    name = 'json-in-text'
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        return f'key|{json.dumps(obj)}'.encode()
+
+    @staticmethod
+    def decode(payload: bytes):
+        return json.loads(payload.decode().split('|', 1)[1])
+
+
+def measure(impl, obj, seconds: float = 0.5):
+    payload = impl.encode(obj)
+    assert impl.decode(payload) == obj
+    rounds, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        impl.decode(impl.encode(obj))
+        rounds += 1
+    return rounds / (time.perf_counter() - start), len(payload)
+
+
+def main():
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    impls = [LegacyText, codec.JsonCodec, codec.MsgpackCodec]
+    for label, obj in ((f'tournament, {players} players', tournament(players)), ('delta, 200 keys', delta(200))):
+        print(label)
+        for impl in impls:
+            rate, size = measure(impl, obj)
+            print(f'  {impl.name:<14} {rate:>10.0f} round trips/s {size:>10} bytes')
+    if codec.msgpack is None:
+        print('msgpack is not installed, MsgpackCodec used its pure Python fallback')
+
+
+if __name__ == '__main__':
+    main()
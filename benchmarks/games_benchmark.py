@@ -0,0 +1,41 @@
+"""Games per second of every registered game, played in process by random bots.
+
+Usage: python benchmarks/games_benchmark.py [games]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from logic.games import GAMES  # noqa: E402
+
+
+def random_rps():
+    return random.choice(['rock', 'paper', 'scissor'])
+
+
+def random_tictactoe(board, mark):
+    return random.choice([i for i, cell in enumerate(board) if cell == '.'])
+
+
+BOTS = {'rps': random_rps, 'tictactoe': random_tictactoe}
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, rules in GAMES.items():
+        bot = BOTS.get(name)
+        if bot is None:
+            print(f'{name:<12} no benchmark bot')
+            continue
+        start = time.perf_counter()
+        result = rules.play_match([bot, bot], games)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<12} {games / elapsed:>12.0f} games/s  cost {rules.cost:>5}  '
+              f'wins {result["wins"]} draws {result["draws"]}')
+
+
+if __name__ == '__main__':
+    main()
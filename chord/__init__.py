@@ -2,3 +2,8 @@ from . import node
 from . import codes
 from . import node_reference
 from . import utils
+from . import transport
+from . import server
+from . import cache
+from . import storage
+from . import codec
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# LRU cache of key hash -> successor node with a time to live per entry
+class LookupCache:
+    def __init__(self, size: int = 256, ttl: float = 30):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: int):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            node, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return node
+
+    def put(self, key: int, node):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (node, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: int = None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+
+# Documents read by the front end, key -> (version, value), kept until the node owning the
+# key says it changed or until they expire. The owner only tells about changes for a while
+# after each read, entries expire before that. A document invalidated while it is being
+# fetched is not kept, the copy on its way may predate the change.
+class DocumentCache:
+    def __init__(self, size: int = 256, ttl: float = 30):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (version, value, expires)
+        self.fetching = {}  # key -> whether it was invalidated since its fetch began
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    # Note a fetch of key is starting, returns when what it brings expires
+    def begin(self, key: str) -> float:
+        with self.lock:
+            self.fetching[key] = False
+            return time.monotonic() + self.ttl
+
+    def put(self, key: str, version: str, value, expires: float):
+        with self.lock:
+            if self.fetching.pop(key, True) or self.size <= 0:
+                return
+            self.entries[key] = (version, value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def abort(self, key: str):
+        with self.lock:
+            self.fetching.pop(key, None)
+
+    def invalidate(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                if key in self.fetching:
+                    self.fetching[key] = True
@@ -0,0 +1,111 @@
+import bisect
+import threading
+
+from .utils import hash_function
+
+# Keys the catalog is stored under in the ring, followed by the shard number. A tournament's
+# entry goes to shard hash(name) % CATALOG_SHARDS, CATALOG_SHARDS a power of two.
+CATALOG_PREFIX = 'catalog:'
+CATALOG_SHARDS = 64
+# Tournaments in a page of a listing, by default and at most
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+STATUSES = ('open', 'running', 'completed')
+
+
+def shard_key(name: str) -> str:
+    return f'{CATALOG_PREFIX}{hash_function(name, CATALOG_SHARDS.bit_length() - 1)}'
+
+
+def shard_keys() -> list:
+    return [f'{CATALOG_PREFIX}{shard}' for shard in range(CATALOG_SHARDS)]
+
+
+# Catalog entry of a tournament document: {'status', 'type', 'created'}, its status open until
+# the first round is drawn, running until a winner is known
+def catalog_entry(tournament: dict) -> dict:
+    if tournament.get('completed'):
+        status = 'completed'
+    elif tournament.get('round'):
+        status = 'running'
+    else:
+        status = 'open'
+    return {'status': status, 'type': tournament.get('type'), 'created': float(tournament.get('created') or 0)}
+
+
+# Entries of every tournament, kept by the leader with an index per status, per type and per
+# both, each sorted newest first, so a page costs a binary search and a slice whatever the
+# number of tournaments. A page ends with a cursor the next one starts after.
+class Catalog:
+    def __init__(self):
+        self.entries = {}  # name -> entry
+        self.indexes = {}  # (status, type), None matching any -> sorted [(-created, name)]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _filters(entry: dict):
+        return (None, None), (entry['status'], None), (None, entry['type']), (entry['status'], entry['type'])
+
+    # Add or update an entry, an entry already there is kept unless replace
+    def put(self, name: str, entry: dict, replace: bool = True) -> bool:
+        with self.lock:
+            old = self.entries.get(name)
+            if old is not None and (not replace or old == entry):
+                return False
+            if old is not None:
+                self._unindex(name, old)
+            self.entries[name] = entry
+            item = (-entry['created'], name)
+            for key in self._filters(entry):
+                bisect.insort(self.indexes.setdefault(key, []), item)
+            return True
+
+    def remove(self, name: str) -> bool:
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is None:
+                return False
+            self._unindex(name, entry)
+            return True
+
+    def _unindex(self, name: str, entry: dict):
+        item = (-entry['created'], name)
+        for key in self._filters(entry):
+            index = self.indexes[key]
+            i = bisect.bisect_left(index, item)
+            if i < len(index) and index[i] == item:
+                del index[i]
+            if not index:
+                del self.indexes[key]
+
+    # Page of the tournaments with the given status and type, newest first, after the cursor
+    # of the previous page: {'items': [{'name', 'status', 'type', 'created'}], 'next': cursor of
+    # the next page or None, 'total': tournaments matching}
+    def page(self, status: str = None, type: str = None, cursor: str = None, limit: int = PAGE_SIZE) -> dict:
+        limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+        with self.lock:
+            index = self.indexes.get((status, type), [])
+            start = bisect.bisect_right(index, self._parse_cursor(cursor)) if cursor else 0
+            items = index[start:start + limit]
+            page = {'items': [dict(self.entries[name], name=name) for _, name in items], 'next': None,
+                    'total': len(index)}
+            if items and start + limit < len(index):
+                created, name = items[-1]
+                page['next'] = f'{-created!r}/{name}'
+            return page
+
+    @staticmethod
+    def _parse_cursor(cursor: str):
+        created, _, name = cursor.partition('/')
+        try:
+            return -float(created), name
+        except ValueError:
+            return ()
+
+    # name -> completed of every tournament, the shape of the listing before the catalog
+    def completed(self) -> dict:
+        with self.lock:
+            return {name: entry['status'] == 'completed' for name, entry in self.entries.items()}
@@ -0,0 +1,221 @@
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Whether msgpack runs its C extension, its pure Python fallback is slower than json
+MSGPACK_C = msgpack is not None and msgpack.Packer.__module__ == 'msgpack._cmsgpack'
+
+# Codec ids, sent in the flags byte of every frame so each side decodes with the codec
+# the payload was encoded with
+JSON = 1
+MSGPACK = 2
+
+
+class JsonCodec:
+    id = JSON
+    name = 'json'
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    @staticmethod
+    def decode(payload: bytes):
+        return json.loads(payload) if payload else None
+
+
+_pack_b = struct.Struct('>B').pack
+_pack_h = struct.Struct('>H').pack
+_pack_i = struct.Struct('>I').pack
+_pack_d = struct.Struct('>d').pack
+
+
+def _pack_int(value: int, out: bytearray):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif 0 <= value <= 0xffffffff:
+        if value <= 0xff:
+            out += b'\xcc' + _pack_b(value)
+        elif value <= 0xffff:
+            out += b'\xcd' + _pack_h(value)
+        else:
+            out += b'\xce' + _pack_i(value)
+    elif 0 <= value < 1 << 64:
+        out += b'\xcf' + struct.pack('>Q', value)
+    elif -0x80 <= value < 0:
+        out += b'\xd0' + struct.pack('>b', value)
+    elif -0x8000 <= value < 0:
+        out += b'\xd1' + struct.pack('>h', value)
+    elif -0x80000000 <= value < 0:
+        out += b'\xd2' + struct.pack('>i', value)
+    elif -(1 << 63) <= value < 0:
+        out += b'\xd3' + struct.pack('>q', value)
+    else:
+        raise ValueError(f'integer {value} does not fit in 64 bits')
+
+
+def _pack_len(size: int, fix: int, fix_max: int, tag8, tag16: int, tag32: int, out: bytearray):
+    if size <= fix_max:
+        out.append(fix | size)
+    elif tag8 is not None and size <= 0xff:
+        out.append(tag8)
+        out.append(size)
+    elif size <= 0xffff:
+        out.append(tag16)
+        out += _pack_h(size)
+    else:
+        out.append(tag32)
+        out += _pack_i(size)
+
+
+def _pack(obj, out: bytearray):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _pack_len(len(data), 0xa0, 31, 0xd9, 0xda, 0xdb, out)
+        out += data
+    elif isinstance(obj, dict):
+        _pack_len(len(obj), 0x80, 15, None, 0xde, 0xdf, out)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    elif isinstance(obj, (list, tuple)):
+        _pack_len(len(obj), 0x90, 15, None, 0xdc, 0xdd, out)
+        for value in obj:
+            _pack(value, out)
+    elif isinstance(obj, float):
+        out.append(0xcb)
+        out += _pack_d(obj)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        data = bytes(obj)
+        if len(data) <= 0xff:
+            out += b'\xc4' + _pack_b(len(data))
+        elif len(data) <= 0xffff:
+            out += b'\xc5' + _pack_h(len(data))
+        else:
+            out += b'\xc6' + _pack_i(len(data))
+        out += data
+    else:
+        raise TypeError(f'cannot encode {type(obj).__name__}')
+
+
+# Fixed size formats: tag -> struct of the value
+_FIXED = {
+    0xcc: struct.Struct('>B'), 0xcd: struct.Struct('>H'), 0xce: struct.Struct('>I'), 0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'), 0xd1: struct.Struct('>h'), 0xd2: struct.Struct('>i'), 0xd3: struct.Struct('>q'),
+    0xca: struct.Struct('>f'), 0xcb: struct.Struct('>d'),
+}
+# Length prefixed formats: tag -> (struct of the length, kind)
+_SIZED = {
+    0xd9: (struct.Struct('>B'), 'str'), 0xda: (struct.Struct('>H'), 'str'), 0xdb: (struct.Struct('>I'), 'str'),
+    0xc4: (struct.Struct('>B'), 'bin'), 0xc5: (struct.Struct('>H'), 'bin'), 0xc6: (struct.Struct('>I'), 'bin'),
+    0xdc: (struct.Struct('>H'), 'array'), 0xdd: (struct.Struct('>I'), 'array'),
+    0xde: (struct.Struct('>H'), 'map'), 0xdf: (struct.Struct('>I'), 'map'),
+}
+
+
+def _unpack(data, pos: int):
+    tag = data[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if 0xa0 <= tag <= 0xbf:
+        size = tag & 0x1f
+        return str(data[pos:pos + size], 'utf-8'), pos + size
+    if 0x90 <= tag <= 0x9f:
+        kind, size = 'array', tag & 0x0f
+    elif 0x80 <= tag <= 0x8f:
+        kind, size = 'map', tag & 0x0f
+    elif tag == 0xc0:
+        return None, pos
+    elif tag == 0xc2:
+        return False, pos
+    elif tag == 0xc3:
+        return True, pos
+    elif tag in _FIXED:
+        fmt = _FIXED[tag]
+        return fmt.unpack_from(data, pos)[0], pos + fmt.size
+    elif tag in _SIZED:
+        fmt, kind = _SIZED[tag]
+        size = fmt.unpack_from(data, pos)[0]
+        pos += fmt.size
+        if kind == 'str':
+            return str(data[pos:pos + size], 'utf-8'), pos + size
+        if kind == 'bin':
+            return bytes(data[pos:pos + size]), pos + size
+    else:
+        raise ValueError(f'unsupported type tag {tag:#x}')
+
+    if kind == 'array':
+        items = []
+        for _ in range(size):
+            value, pos = _unpack(data, pos)
+            items.append(value)
+        return items, pos
+    items = {}
+    for _ in range(size):
+        key, pos = _unpack(data, pos)
+        items[key], pos = _unpack(data, pos)
+    return items, pos
+
+
+# MessagePack encoding: compact binary, no escaping and no text parsing. Uses the msgpack
+# package when it is installed and a pure Python implementation of the same format
+# otherwise, so nodes with and without it understand each other.
+class MsgpackCodec:
+    id = MSGPACK
+    name = 'msgpack'
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        if msgpack is not None:
+            return msgpack.packb(obj, use_bin_type=True)
+        out = bytearray()
+        _pack(obj, out)
+        return bytes(out)
+
+    @staticmethod
+    def decode(payload: bytes):
+        if not payload:
+            return None
+        if msgpack is not None:
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        value, _ = _unpack(memoryview(payload), 0)
+        return value
+
+
+CODECS = {JsonCodec.id: JsonCodec, MsgpackCodec.id: MsgpackCodec}
+
+
+def get_codec(codec_id: int):
+    try:
+        return CODECS[codec_id]
+    except KeyError:
+        raise ValueError(f'unknown codec {codec_id}')
+
+
+def codec_by_name(name: str):
+    for codec in CODECS.values():
+        if codec.name == name:
+            return codec
+    raise ValueError(f'unknown codec {name}')
+
+
+# The binary codec is only cheaper than the C json module with msgpack's C extension
+def default_codec():
+    return MsgpackCodec if MSGPACK_C else JsonCodec
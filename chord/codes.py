@@ -14,3 +14,28 @@ SEND_TOURNAMENTS = 13
 SIMULATE_TOURNAMENT = 14
 TOURNAMENT_RESULT = 15
 RUN_GAME = 16
+LOOKUP = 17
+STORE_KEYS = 18
+REPLICATE = 19
+DIGEST = 20
+SEND_RANGE = 21
+GET_SUCCESSORS = 22
+APPEND_RESULT = 23
+RUN_GAMES = 24
+GAME_LOAD = 25
+STEAL_GAMES = 26
+CANCEL_GAMES = 27
+CHECKPOINT = 28
+TOURNAMENT_STATUS = 29
+LIST_TOURNAMENTS = 30
+UPDATE_CATALOG = 31
+WATCH_KEY = 32
+INVALIDATE = 33
+SUBSCRIBE_EVENTS = 34
+PUSH_EVENTS = 35
+
+# Response status codes, sent in the op field of response frames
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_TOO_LARGE = 2
+STATUS_BUSY = 3
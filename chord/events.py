@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+# Events of a tournament kept for readers that fall behind
+EVENT_LOG_SIZE = 1024
+
+
+# Numbered events of a tournament, the last EVENT_LOG_SIZE of them. A reader keeps the
+# (epoch, seq) of the last event it got and asks for the ones after it. Readers without a
+# version start from the next event, readers of another epoch or that fell behind the
+# oldest event kept are told some were lost ('full').
+class EventLog:
+    def __init__(self, size: int = EVENT_LOG_SIZE):
+        self.epoch = os.urandom(4).hex()  # Identifies this incarnation of the sequence
+        self.seq = 0
+        self.events = deque(maxlen=size)  # [seq, event], oldest first
+        self.condition = threading.Condition()
+
+    @property
+    def version(self):
+        return self.epoch, self.seq
+
+    # Add events, returns them as a delta {'epoch', 'seq', 'full', 'events': [[seq, event]]}
+    def append(self, events: list) -> dict:
+        with self.condition:
+            added = []
+            for event in events:
+                self.seq += 1
+                added.append([self.seq, event])
+            self.events.extend(added)
+            self.condition.notify_all()
+            return {'epoch': self.epoch, 'seq': self.seq, 'full': False, 'events': added}
+
+    def since(self, epoch: str = None, since: int = 0) -> dict:
+        with self.condition:
+            return self._since(epoch, since)
+
+    # Events after version (epoch, since), waiting up to timeout seconds for one when there is none
+    def wait(self, epoch: str = None, since: int = 0, timeout: float = None) -> dict:
+        with self.condition:
+            if epoch is None:
+                epoch, since = self.epoch, self.seq
+            self.condition.wait_for(lambda: self.epoch != epoch or self.seq > since, timeout)
+            return self._since(epoch, since)
+
+    def _since(self, epoch: str, since: int) -> dict:
+        delta = {'epoch': self.epoch, 'seq': self.seq, 'full': False, 'events': []}
+        if epoch is None:
+            return delta
+        if epoch != self.epoch:
+            delta['full'] = True
+            return delta
+        first = self.events[0][0] if self.events else self.seq + 1
+        delta['full'] = since < first - 1
+        delta['events'] = list(islice(self.events, max(since - first + 1, 0), None))
+        return delta
+
+
+# Copy of an owner's event log kept by a front end for its readers, numbered on its own. The
+# owner pushes its new events, a push that does not follow the last one merged is refused so
+# the missing ones are pulled. When events were lost, e.g. the tournament moved to another
+# node, readers get a 'reset' event to reload the tournament.
+class EventFeed(EventLog):
+    def __init__(self, size: int = EVENT_LOG_SIZE):
+        super().__init__(size)
+        self.source = (None, 0)  # Version of the owner's log merged so far
+        self.renewed = 0  # When the subscription to the owner was last renewed
+        self.used = time.monotonic()  # When a reader last asked for events
+
+    # Merge a delta of the owner's log, False if events are missing between the two
+    def merge(self, delta: dict) -> bool:
+        with self.condition:
+            epoch, seq = self.source
+            if delta['epoch'] != epoch or delta['full']:
+                if epoch is not None:
+                    self.append([{'type': 'reset'}])
+                seq = 0
+            elif delta['events'] and delta['events'][0][0] > seq + 1:
+                return False
+            events = [event for number, event in delta['events'] if number > seq]
+            if events:
+                self.append(events)
+            self.source = (delta['epoch'], max(seq, delta['seq']))
+            return True
@@ -0,0 +1,89 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Removed tournaments remembered in the change log before the oldest are forgotten
+MAX_TOMBSTONES = 1024
+
+
+# Versioned map of tournament name -> catalog entry. A node keeps one for the tournaments it
+# owns and gossips only its (epoch, seq) version, whoever is behind pulls the changes since
+# the version it has, or a full copy once they are no longer all in the change log. The
+# leader keeps a mirror of every node's table the same way.
+class StatusTable:
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()  # Identifies this incarnation of the sequence
+        self.seq = 0
+        self.entries = {}  # name -> catalog entry
+        self.changes = OrderedDict()  # name -> seq of its last change, oldest first, removals included
+        self.floor = 0  # Changes up to this seq are no longer all in the change log
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    @property
+    def version(self):
+        return self.epoch, self.seq
+
+    def set(self, name: str, entry: dict) -> bool:
+        with self.lock:
+            if name in self.entries and self.entries[name] == entry:
+                return False
+            self.entries[name] = entry
+            self._changed(name)
+            return True
+
+    def remove(self, name: str) -> bool:
+        with self.lock:
+            if name not in self.entries:
+                return False
+            del self.entries[name]
+            self._changed(name)
+            return True
+
+    def _changed(self, name: str):
+        self.seq += 1
+        self.changes[name] = self.seq
+        self.changes.move_to_end(name)
+        if len(self.changes) - len(self.entries) > 2 * MAX_TOMBSTONES:
+            excess = len(self.changes) - len(self.entries) - MAX_TOMBSTONES
+            for key, seq in list(self.changes.items()):
+                if excess <= 0:
+                    break
+                if key not in self.entries:
+                    del self.changes[key]
+                    self.floor = max(self.floor, seq)
+                    excess -= 1
+
+    # Changes after version (epoch, since) as {'epoch', 'seq', 'full', 'items': {name: entry},
+    # 'removed': [name]}, the whole table when they are not all in the change log anymore
+    def delta(self, epoch: str = None, since: int = 0) -> dict:
+        with self.lock:
+            if epoch != self.epoch or since < self.floor:
+                return {'epoch': self.epoch, 'seq': self.seq, 'full': True, 'items': dict(self.entries),
+                        'removed': []}
+            items, removed = {}, []
+            for name in reversed(self.changes):
+                if self.changes[name] <= since:
+                    break
+                if name in self.entries:
+                    items[name] = self.entries[name]
+                else:
+                    removed.append(name)
+            return {'epoch': self.epoch, 'seq': self.seq, 'full': False, 'items': items, 'removed': removed}
+
+    # Apply a delta of the table being mirrored, returns the names it no longer holds
+    def apply(self, delta: dict) -> list:
+        with self.lock:
+            if delta['full']:
+                removed = [name for name in self.entries if name not in delta['items']]
+                self.entries = dict(delta['items'])
+            else:
+                removed = [name for name in delta['removed'] if self.entries.pop(name, None) is not None]
+                self.entries.update(delta['items'])
+            self.epoch, self.seq = delta['epoch'], delta['seq']
+            return removed
@@ -1,33 +1,135 @@
 import logging
 import os
+import threading
+import time
 
 current_dir = os.getcwd()
 db_path = os.path.join(os.path.dirname(__file__), '../db')
 import json
 
+# Log size in bytes below which the log is never compacted into the snapshot
+COMPACT_MIN_BYTES = 1024 * 1024
 
+
+# Node storage on disk: a snapshot of the data plus an append-only log of the updates made
+# after it. Updates cost one appended line, the log is folded into a new snapshot once it
+# outgrows it. fsync policy: 'always' (every update), 'interval' (at most every
+# fsync_interval seconds) or 'never' (left to the OS).
 class Handler:
-    def __init__(self, id):
+    def __init__(self, id, fsync: str = 'interval', fsync_interval: float = 1.0):
         self.id = id
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
         if not os.path.exists(db_path):
             os.makedirs(db_path)
         self.db_folder = os.path.join(db_path, str(self.id))
         if not os.path.exists(self.db_folder):
             os.makedirs(self.db_folder)
+        self.snapshot_file = os.path.join(self.db_folder, f"{self.id}.json")
+        self.log_file = os.path.join(self.db_folder, f"{self.id}.log")
+        self.old_log_file = self.log_file + '.old'  # Log being folded into a snapshot
+        self.lock = threading.Lock()
+        self.log = None
+        self.log_bytes = 0
+        self.unsynced = False
+        self.last_sync = time.monotonic()
 
+    # Load the snapshot and replay the logs written after it
     def initial_data(self):
-        file = os.path.join(self.db_folder, f"{self.id}.json")
-        if os.path.isfile(file):
-            with open(file, 'r') as archivo:
+        data = {}
+        if os.path.isfile(self.snapshot_file):
+            with open(self.snapshot_file, 'r') as archivo:
                 try:
-                    return json.load(archivo)
+                    data = json.load(archivo)
                 except Exception as e:
-                    return {}
-        return {}
+                    corrupt = self.snapshot_file + '.corrupt'
+                    os.replace(self.snapshot_file, corrupt)
+                    logging.error(f'snapshot {self.snapshot_file} is unreadable ({e}), moved to {corrupt}')
+        for log_file in (self.old_log_file, self.log_file):
+            if os.path.isfile(log_file):
+                self._replay(log_file, data)
+        if os.path.isfile(self.old_log_file):
+            # A compaction was interrupted, finish it before new updates are logged
+            self.create(self.id, data)
+            if os.path.isfile(self.log_file):
+                os.remove(self.log_file)
+            os.remove(self.old_log_file)
+        self.log = open(self.log_file, 'a')
+        self.log_bytes = self.log.tell()
+        logging.info(f'loaded {len(data)} keys from {self.db_folder}')
+        return data
+
+    def _replay(self, log_file, data: dict):
+        valid = 0
+        with open(log_file, 'rb') as archivo:
+            for number, line in enumerate(archivo, 1):
+                try:
+                    op, key, value = json.loads(line)
+                except Exception as e:
+                    # A crash mid-append leaves a partial last line, drop it and anything after
+                    logging.error(f'{log_file}:{number} is unreadable ({e}), ignoring the rest of the log')
+                    break
+                if op == 'set':
+                    data[key] = value
+                else:
+                    data.pop(key, None)
+                valid += len(line)
+        if valid != os.path.getsize(log_file):
+            os.truncate(log_file, valid)
+
+    # Append one update to the log
+    def append(self, op: str, key: str, value=None):
+        line = json.dumps([op, key, value]) + '\n'
+        with self.lock:
+            if self.log is None:
+                self.log = open(self.log_file, 'a')
+            self.log.write(line)
+            self.log_bytes += len(line)
+            self.unsynced = True
+            if self.fsync == 'always' or (self.fsync == 'interval' and
+                                          time.monotonic() - self.last_sync >= self.fsync_interval):
+                self._sync()
+
+    def _sync(self):
+        self.log.flush()
+        if self.fsync != 'never':
+            os.fsync(self.log.fileno())
+        self.unsynced = False
+        self.last_sync = time.monotonic()
+
+    # Flush updates still waiting for their fsync
+    def sync(self):
+        with self.lock:
+            if self.log is not None and self.unsynced:
+                self._sync()
+
+    def needs_compaction(self) -> bool:
+        snapshot_bytes = os.path.getsize(self.snapshot_file) if os.path.isfile(self.snapshot_file) else 0
+        return self.log_bytes > max(COMPACT_MIN_BYTES, snapshot_bytes)
+
+    # Fold the log into a new snapshot. get_data is called after the log is rotated, so every
+    # update it misses is in the new log and replayed on top of the snapshot at startup.
+    def compact(self, get_data):
+        with self.lock:
+            if self.log is not None:
+                self._sync()
+                self.log.close()
+            if os.path.isfile(self.log_file):
+                os.replace(self.log_file, self.old_log_file)
+            self.log = open(self.log_file, 'a')
+            self.log_bytes = 0
+        self.create(self.id, get_data())
+        if os.path.isfile(self.old_log_file):
+            os.remove(self.old_log_file)
 
+    # Write a full snapshot atomically: a crash leaves either the old or the new file
     def create(self, id, data):
         json_file = os.path.join(self.db_folder, f"{id}.json")
-        with open(json_file, 'w') as file:
+        tmp_file = json_file + '.tmp'
+        with open(tmp_file, 'w') as file:
             json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_file, json_file)
 
         logging.info(f'data created in file {json_file}')
@@ -6,34 +6,157 @@ import json
 from .codes import *
 from .node_reference import ChordNodeReference
 from .handler import Handler
+from .server import RequestServer, Busy
+from .cache import LookupCache, DocumentCache
+from .catalog import Catalog, CATALOG_PREFIX, PAGE_SIZE, catalog_entry, shard_key, shard_keys
+from .events import EventLog, EventFeed
+from .gossip import StatusTable
+from .scheduler import GameScheduler
+from .codec import codec_by_name
+from .storage import KeyStore
+from .transport import MAX_MESSAGE_SIZE
 from .utils import hash_function, _inbetween
-from logic.tournament import TournamentSimulator
+from logic.tournament import TournamentSimulator, player_cache
+from logic.state import TournamentState
+from logic.engine import GameEngine, QUEUE_SIZE, GAME_TIMEOUT
 import copy
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s')
 BROADCAST_PORT = 9001
 TOURNAMENT_PORT = 9002
+# Seconds between flushes of the local log to disk
+PERSIST_INTERVAL = 1
+# Seconds between ownership checks of local keys when the ring does not change
+MIGRATION_INTERVAL = 60
+# Seconds between pulls of predecessor changes into the local replicas
+REPLICA_SYNC_INTERVAL = 8
+# Seconds between digest comparisons of the replicas with their owners
+ANTI_ENTROPY_INTERVAL = 60
+# Hops after which a lookup gives up
+MAX_LOOKUP_HOPS = 32
+# Seconds game results are gathered on the owner before the tournament is written once for all
+RESULT_BATCH_DELAY = 0.02
+# Seconds a result waits for its batch to be stored, and attempts at reaching the owner
+RESULT_TIMEOUT = 10
+RESULT_RETRIES = 3
+# Games sent to a node in one request, and requests to different nodes in flight
+DISPATCH_BATCH = 256
+DISPATCH_WORKERS = 16
+# Seconds between two schedules of a round when no game finishes, and a node has to advertise its load
+SCHEDULE_INTERVAL = 0.05
+LOAD_TIMEOUT = 1
+# Seconds between two polls of the loads of the nodes, for all the rounds coordinated here, while
+# games wait to be placed and while they do not. Results coming in free slots in between.
+LOAD_POLL_INTERVAL = 0.5
+LOAD_IDLE_INTERVAL = 2
+# Seconds between saves of a round's lease table, and between checks for owned rounds nobody coordinates
+LEASE_SYNC_INTERVAL = 1
+ROUND_CHECK_INTERVAL = 5
+# Seconds between checks for tournament status changes to gossip, the longest a node stays
+# quiet when nothing changes, and how long the leader remembers a node it stopped hearing from
+GOSSIP_INTERVAL = 1
+GOSSIP_MAX_INTERVAL = 30
+GOSSIP_EXPIRY = 3 * GOSSIP_MAX_INTERVAL
+# Seconds an owner tells a node that read a key about its changes, which is as long as the
+# node may serve its copy, and seconds a page of the tournament catalog is served from cache
+WATCH_TIME = 30
+LIST_CACHE_TTL = 2
+# Seconds an owner pushes a tournament's events to a front end after it subscribed, and the
+# longest a reader waits for the next one
+SUBSCRIBE_TIME = 30
+EVENT_WAIT = 10
+# Keys player code is stored under, followed by the sha256 of the code
+CODE_PREFIX = 'code:'
+# Keys the lease table of a tournament's current round is stored under, followed by its name
+LEASE_PREFIX = 'leases:'
+# Times a node fails to fetch the code of a game's player before that player loses the game
+CODE_FETCH_RETRIES = 3
+# Requests answered on the server loop without waiting for a worker: they only read or
+# assign local state and never make outbound calls. Reads of the key store are left out,
+# its lock is held while a write is journaled, which may wait on the disk.
+FAST_OPS = {CHECK, GET_SUCCESSOR, GET_PREDECESSOR, GET_SUCCESSORS, CLOSEST_PRECEDING_FINGER, LOOKUP, UPDATE_SUCCESSOR,
+            UPDATE_PREDECESSOR, SEND_TOURNAMENTS, GAME_LOAD, STEAL_GAMES, CANCEL_GAMES, CHECKPOINT,
+            TOURNAMENT_STATUS, LIST_TOURNAMENTS, INVALIDATE, SUBSCRIBE_EVENTS, PUSH_EVENTS}
 
 
 class ChordNode:
-    def __init__(self, ip: str, port: int = 8001, m: int = 8):
+    def __init__(self, ip: str, port: int = 8001, m: int = 8, workers: int = 8, backlog: int = 128,
+                 max_pending: int = 64, max_message_size: int = MAX_MESSAGE_SIZE, lookup_mode: str = 'next_hop',
+                 lookup_cache_size: int = 256, lookup_cache_ttl: float = 30, replication_factor: int = 3,
+                 write_quorum: int = 1, read_from_replicas: bool = True, fsync_policy: str = 'interval',
+                 codec: str = None, game_workers: int = None, game_queue: int = QUEUE_SIZE,
+                 game_timeout: float = GAME_TIMEOUT, document_cache_size: int = 256):
         self.id = hash_function(ip, m)
         self.ip = ip
         self.port = port
+        self.workers = workers  # Threads serving requests that may block
+        self.backlog = backlog  # Listen backlog of the server socket
+        self.max_pending = max_pending  # Requests queued for workers before reads are paused
+        self.max_message_size = max_message_size  # Largest request payload accepted, in bytes
+        self.lookup_mode = lookup_mode  # 'next_hop' (one RPC per hop, answered on the server loop) or 'iterative'
+        self.lookup_cache = LookupCache(lookup_cache_size, lookup_cache_ttl)
+        self.replication_factor = replication_factor  # Copies of each key, the owner's included
+        self.write_quorum = write_quorum  # Copies that must hold a write before it is acknowledged
+        self.read_from_replicas = read_from_replicas  # Spread reads of the front end over all copies
+        self.replica_cache = LookupCache(lookup_cache_size, lookup_cache_ttl)  # owner id -> replica nodes
+        self.document_cache = DocumentCache(document_cache_size, WATCH_TIME)  # Documents read by the front end
+        self.list_cache = LookupCache(lookup_cache_size, LIST_CACHE_TTL)  # listing arguments -> catalog page
+        self.watchers = {}  # key -> {(ip, port): until when} of the nodes to tell when it changes
+        self.watch_lock = threading.Lock()
+        self.watch_event = threading.Event()  # Set when local data changed and watchers may have to be told
+        self.event_logs = {}  # tournament name -> EventLog of an owned tournament somebody follows
+        self.subscribers = {}  # tournament name -> {(ip, port): until when} of the nodes to push its events to
+        self.event_feeds = {}  # tournament name -> EventFeed read by the front end
+        self.event_lock = threading.Lock()
+        if codec:
+            # Encoding of outgoing requests ('json' or 'msgpack'), incoming ones may use either
+            ChordNodeReference.codec = codec_by_name(codec)
+        # Worker processes running player code, one per core unless set
+        self.engine = GameEngine(game_workers, game_queue, game_timeout)
         self.ref = ChordNodeReference(self.ip, self.port)
         self.successor = self.ref
         self.predecessor = None
-        self.predecessor2 = None
-        self.predecessor3 = None
-        self.handler = Handler(self.id)
+        self.predecessors = []  # Up to replication_factor - 1 nodes before this one, nearest first
+        self.successors = [self.ref]  # Up to replication_factor nodes after this one, nearest first
+        self.handler = Handler(self.id, fsync_policy)
         self.m = m
         self.finger = [self.ref] * self.m
         self.next = 0  # Finger table index to fix next
-        self.data = self.handler.initial_data()
-        self.pred_data = {}
-        self.pred2_data = {}
+        self.data = KeyStore(m, self.handler.initial_data())
+        self.data.journal = self.handler  # Every local update is appended to the node's log
+        self.topology_event = threading.Event()  # Set when keys may have to move to another node
+        self.replication_event = threading.Event()  # Set when local writes have to be pushed to replicas
+        self.replicas = {}  # owner id -> KeyStore mirroring that predecessor's data
+        self.push_locks = {}  # successor id -> lock serializing pushes to it
+        self.pushed = {}  # successor id -> (epoch, seq) of the last change it acknowledged
+        self.replication_pool = ThreadPoolExecutor(max_workers=max(1, replication_factor - 1),
+                                                   thread_name_prefix='replication')
         self.lock = threading.Lock()
-        self.tournaments = {}
+        self.catalog = Catalog()  # Entries of every tournament, kept by the leader
+        self.catalog_pending = {}  # catalog shard key -> {name: entry} of owned tournaments not written yet
+        self.catalog_lock = threading.Lock()  # Serializes updates of the catalog shards owned here
+        self.status = StatusTable()  # name -> catalog entry of the tournaments this node owns
+        self.status_synced = (None, 0)  # Version of the local data the status table reflects
+        self.status_mirrors = {}  # node id -> StatusTable mirroring that node's, on the leader
+        self.status_heard = {}  # node id -> when it last gossiped
+        self.status_pulls = {}  # node id -> pull of its changes in flight
+        self.status_lock = threading.Lock()
+        self.tournament_locks = {}  # tournament name -> lock serializing its result updates
+        self.result_batches = {}  # tournament name -> results waiting to be applied by its owner
+        self.result_lock = threading.Lock()
+        self.result_event = threading.Event()
+        self.tournament_states = {}  # tournament name -> (stored document, its TournamentState)
+        self.dispatch_pool = ThreadPoolExecutor(max_workers=DISPATCH_WORKERS, thread_name_prefix='dispatch')
+        self.scheduler = GameScheduler()  # Placement of the games of the rounds this node coordinates
+        self.coordinating = set()  # 'tournament-round' of the rounds coordinated here
+        self.saved_leases = {}  # 'tournament-round' -> lease table last stored
+        self.load_polls = {}  # node id -> load request in flight
+        self.code_misses = {}  # game key -> times the code of one of its players could not be fetched
+        self.loads_polled = 0  # When the loads were last polled
+        self.load_lock = threading.Lock()
+        self.metrics = {}  # name -> last value, e.g. 'dispatch' timing of the last round sent
         self.leader = False
         self.leader_ref = None
         # Start background threads for stabilization, fixing fingers, and checking predecessor
@@ -45,7 +168,11 @@ class ChordNode:
         threading.Thread(target=self.fix_fingers, daemon=True).start()  # Start fix fingers thread
         threading.Thread(target=self.check_predecessor, daemon=True).start()  # Start check predecessor thread
         threading.Thread(target=self.get_data_from_predecessors, daemon=True).start()
+        threading.Thread(target=self.replicate_data, daemon=True).start()
         threading.Thread(target=self.update_data, daemon=True).start()
+        threading.Thread(target=self.aggregate_results, daemon=True).start()
+        threading.Thread(target=self.watch_rounds, daemon=True).start()
+        threading.Thread(target=self.push_invalidations, daemon=True).start()
         self.send_broadcast_join()
 
     def handle_join(self, node_id: int, node_ip: str, node_port: int):
@@ -57,8 +184,7 @@ class ChordNode:
             if self.predecessor is None and self.id == self.successor.id:
                 with self.lock:
                     self.predecessor = new_node_ref
-                    self.predecessor2 = self.ref
-                    self.predecessor3 = new_node_ref
+                    self.predecessors = [new_node_ref]
                     self.predecessor.update_successor(self.ref)
                 logging.info(f"Update predecessor to {self.predecessor}")
 
@@ -73,8 +199,7 @@ class ChordNode:
                     self.predecessor.update_successor(new_node_ref)
                     self.predecessor = new_node_ref
                     self.predecessor.update_successor(self.ref)
-                    self.predecessor2 = self.predecessor.predecessor if self.predecessor else None
-                    self.predecessor3 = self.predecessor2.predecessor if self.predecessor2 else None
+                    self._update_predecessors()
                 logging.info(f"Update predecessor to {self.predecessor}")
 
             if _inbetween(node_id, self.id, self.successor.id):
@@ -83,6 +208,7 @@ class ChordNode:
                         self.successor = new_node_ref
                         self.successor.notify(self.ref)
                         logging.info(f"Update successor to {self.successor}")
+            self._topology_changed()
 
     def listen_for_broadcast(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -107,60 +233,166 @@ class ChordNode:
                 node_port = int(message[2])
                 self.leader_ref = ChordNodeReference(node_ip, node_port)
 
+    # Bring the status table of the owned tournaments up to date with the local data, from the
+    # data's change log so only the keys written since the last time are looked at. Entries that
+    # changed are written to the catalog stored in the ring too.
+    def _sync_status(self):
+        epoch, seq = self.status_synced
+        delta = self.data.changes_since(epoch, seq)
+        if delta['full']:
+            for name in list(self.status.entries):
+                if name not in delta['items']:
+                    self.status.remove(name)
+        for key, (_, value) in delta['items'].items():
+            if key.startswith((CODE_PREFIX, CATALOG_PREFIX)) or not isinstance(value, dict):
+                continue
+            entry = catalog_entry(value)
+            if self.status.set(key, entry):
+                self.catalog_pending.setdefault(shard_key(key), {})[key] = entry
+        # A tournament whose key moved keeps its catalog entry, its new owner lists it
+        for key, _ in delta['deleted']:
+            self.status.remove(key)
+        self.status_synced = (delta['epoch'], delta['seq'])
+        self._flush_catalog()
+
+    # Write the pending catalog entries, one request per shard, the ones that fail are retried
+    # on the next sync
+    def _flush_catalog(self):
+        for key, entries in list(self.catalog_pending.items()):
+            node = self.find_successor(hash_function(key, self.m))
+            if node and node.update_catalog(key, entries):
+                del self.catalog_pending[key]
+            else:
+                logging.error(f'Could not write {len(entries)} catalog entries to {key}')
+
+    # Merge entries into a catalog shard owned by this node
+    def update_catalog(self, key: str, entries: dict) -> bool:
+        with self.catalog_lock:
+            shard = dict(self.data.get(key) or {})
+            shard.update(entries)
+            return self.put_local(key, shard)
+
+    # Fill the catalog from its shards in the ring once this node becomes the leader, entries
+    # already pulled from the nodes are newer and kept
+    def _load_catalog(self):
+        loaded = 0
+        for key in shard_keys():
+            try:
+                shard = self.retrieve_key(key)
+            except Exception as e:
+                logging.error(f'Error loading catalog shard {key}: {e}')
+                continue
+            for name, entry in (shard or {}).items():
+                loaded += self.catalog.put(name, entry, replace=False)
+        logging.info(f'Loaded {loaded} tournaments from the catalog, {len(self.catalog)} known')
+
+    # Gossip the version of the status table, right after it changes and then less and less
+    # often while it does not, up to GOSSIP_MAX_INTERVAL. The table itself is pulled over TCP.
     def notify_tournament(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        announced = None
+        interval = GOSSIP_INTERVAL
+        last = 0
         while True:
-            _tournaments = []
-            for key, value in self.data.items():
-                _tournaments.append({'id': key, 'completed': value['completed']})
-            _tournaments = json.dumps(_tournaments)
-            message = f"TOURNAMENT|{_tournaments}".encode('utf-8')
-            sock.sendto(message, ('255.255.255.255', TOURNAMENT_PORT))
-            logging.info(f"Notify tournaments {_tournaments}")
-            time.sleep(2)
+            try:
+                self._sync_status()
+                epoch, seq = self.status.version
+                now = time.monotonic()
+                if (epoch, seq) != announced:
+                    interval = GOSSIP_INTERVAL
+                if (epoch, seq) != announced or now - last >= interval:
+                    if (epoch, seq) == announced:
+                        interval = min(interval * 2, GOSSIP_MAX_INTERVAL)
+                    message = f"TOURNAMENT|{self.id}|{self.ip}|{self.port}|{epoch}|{seq}".encode('utf-8')
+                    sock.sendto(message, ('255.255.255.255', TOURNAMENT_PORT))
+                    logging.info(f"Notify tournaments version {epoch}:{seq}, {len(self.status)} tournaments")
+                    announced, last = (epoch, seq), now
+            except Exception as e:
+                logging.error(f"Error notifying tournaments: {e}")
+            time.sleep(GOSSIP_INTERVAL)
 
+    # The leader pulls the changes of every node whose announced version is ahead of its
+    # mirror of that node's table, and forgets nodes it has not heard from in a while
     def recv_tournament(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         sock.bind(('', TOURNAMENT_PORT))
+        sock.settimeout(GOSSIP_INTERVAL)
         logging.info(f"Listening on tournament port: {TOURNAMENT_PORT}")
 
         while True:
             try:
+                self._expire_status_mirrors()
                 data, addr = sock.recvfrom(1024)
                 message = data.decode('utf-8').split('|')
 
-                if not message[0] == "TOURNAMENT":
+                if not message[0] == "TOURNAMENT" or len(message) != 6:
                     continue
                 if not self.leader:
                     continue
 
-                _tournaments = message[1]
-                tournaments = json.loads(_tournaments)
-
-                if len(tournaments) == 0:
-                    continue
-
-                logging.info(f"Received tournaments: {tournaments}")
-                for tournament in tournaments:
-                    if tournament['id'] in self.tournaments and tournament['completed']:
-                        self.tournaments[tournament['id']] = tournament['completed']
-                    else:
-                        self.tournaments[tournament['id']] = tournament['completed']
-
-            except json.JSONDecodeError as e:
-                logging.error(f"Error decoding JSON: {e}")
+                _, node_id, node_ip, node_port, epoch, seq = message
+                node_id, node_port, seq = int(node_id), int(node_port), int(seq)
+                with self.status_lock:
+                    mirror = self.status_mirrors.get(node_id)
+                    if mirror is None:
+                        mirror = self.status_mirrors[node_id] = StatusTable()
+                    self.status_heard[node_id] = time.monotonic()
+                    if mirror.version == (epoch, seq):
+                        continue
+                    pull = self.status_pulls.get(node_id)
+                    if pull is not None and not pull.done():
+                        continue
+                    self.status_pulls[node_id] = self.dispatch_pool.submit(
+                        self._pull_status, ChordNodeReference(node_ip, node_port), mirror)
+            except socket.timeout:
+                continue
             except Exception as e:
                 logging.error(f"Error receiving tournament: {e}")
 
-            time.sleep(2)
+    def _pull_status(self, node: 'ChordNodeReference', mirror: StatusTable):
+        delta = node.tournament_status(*mirror.version)
+        if not delta:
+            logging.error(f"Could not pull the tournaments of {node}")
+            return
+        # Tournaments a node stops listing moved to another node, which lists them in turn
+        mirror.apply(delta)
+        for name, entry in delta['items'].items():
+            self.catalog.put(name, entry)
+        logging.info(f"Pulled {len(delta['items'])} tournament changes from {node}, "
+                     f"{len(self.catalog)} tournaments known")
+
+    def _expire_status_mirrors(self):
+        now = time.monotonic()
+        with self.status_lock:
+            for node_id, heard in list(self.status_heard.items()):
+                if now - heard > GOSSIP_EXPIRY:
+                    del self.status_heard[node_id]
+                    self.status_mirrors.pop(node_id, None)
+
+    def tournament_status(self, epoch: str = None, since: int = 0) -> dict:
+        return self.status.delta(epoch, since)
 
     def get_tournaments(self):
         return self.leader_ref.send_tournaments()
 
+    # Page of the tournament catalog from the leader, see Catalog.page. Pages are cached for
+    # LIST_CACHE_TTL seconds, the catalog itself only catches up with the nodes every few.
+    def list_tournaments(self, status: str = None, type: str = None, cursor: str = None,
+                         limit: int = PAGE_SIZE) -> dict:
+        if self.leader_ref is None:
+            return None
+        args = (status, type, cursor, limit)
+        page = self.list_cache.get(args)
+        if page is None:
+            page = self.leader_ref.list_tournaments(status, type, cursor, limit)
+            if page is not None:
+                self.list_cache.put(args, page)
+        return page
+
     def send_broadcast_join(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -174,17 +406,63 @@ class ChordNode:
 
     def update_successor(self, node: 'ChordNodeReference'):
         self.successor = node
+        self._topology_changed()
 
     def update_predecessor(self, node: 'ChordNodeReference'):
         self.predecessor = node
+        self._topology_changed()
+
+    # Called whenever the successor or predecessor changes, cached lookups may be stale
+    def _topology_changed(self):
+        self.lookup_cache.invalidate()
+        self.topology_event.set()
+
+    # Method to find the successor of a given id, None when the nodes on the way did not answer.
+    # Callers try again later, or with use_cache off, rather than use a guess.
+    def find_successor(self, id: int, use_cache: bool = True) -> 'ChordNodeReference':
+        predecessor = self.predecessor
+        if predecessor and predecessor.id != self.id and _inbetween(id, predecessor.id, self.id):
+            return self.ref
+        if use_cache:
+            node = self.lookup_cache.get(id)
+            if node:
+                return node
 
-    # Method to find the successor of a given id
-    def find_successor(self, id: int) -> 'ChordNodeReference':
-        node = self.find_predecessor(id)  # Find predecessor of id
-        if node:
-            return node.successor  # Return successor of that node
+        if self.lookup_mode == 'next_hop':
+            node = self.lookup(id)
         else:
-            return self.ref
+            node = self.find_predecessor(id)  # Find predecessor of id
+            node = node.successor if node else None  # Return successor of that node
+        if node is None:
+            logging.error(f'no successor of {id} found')
+            return None
+        if use_cache:
+            self.lookup_cache.put(id, node)
+        return node
+
+    # Lookup walked by the caller, one request per hop: each node asked answers with the
+    # successor of id when id falls before it, else with the node to ask next. None when a
+    # node did not answer or no successor was found within MAX_LOOKUP_HOPS.
+    def lookup(self, id: int) -> 'ChordNodeReference':
+        node = self
+        for _ in range(MAX_LOOKUP_HOPS):
+            hop = node.next_hop(id)
+            if hop is None:
+                return None
+            found, node = hop
+            if found:
+                return node
+        logging.error(f'lookup of {id} exceeded {MAX_LOOKUP_HOPS} hops')
+        return None
+
+    # One hop of a lookup, from local state only: (True, successor) if id falls between this
+    # node and its successor, else (False, closest preceding finger)
+    def next_hop(self, id: int):
+        successor = self.successor
+        if successor.id == self.id or _inbetween(id, self.id, successor.id):
+            return True, successor
+        node = self.closest_preceding_finger(id)
+        return False, successor if node.id == self.id else node
 
     # Method to find the predecessor of a given id
     def find_predecessor(self, id: int) -> 'ChordNodeReference':
@@ -196,10 +474,11 @@ class ChordNode:
         except Exception as e:
             logging.info(f"Error finding predecessor")
 
-    # Method to find the closest preceding finger of a given id
+    # Method to find the closest preceding finger of a given id, a finger at id itself is its
+    # successor and does not precede it
     def closest_preceding_finger(self, id: int) -> 'ChordNodeReference':
         for i in range(self.m - 1, -1, -1):
-            if self.finger[i] and _inbetween(self.finger[i].id, self.id, id):
+            if self.finger[i] and self.finger[i].id != id and _inbetween(self.finger[i].id, self.id, id):
                 return self.finger[i]
         return self.ref
 
@@ -209,19 +488,27 @@ class ChordNode:
             try:
                 if self.successor and self.successor.id != self.id:
                     logging.info('stabilize')
+                    if not self.successor.check():
+                        self._replace_successor()
+                if self.successor and self.successor.id != self.id:
                     x = self.successor.predecessor
                     logging.info(f'predecessor of successor: {x}')
                     if x and x.id != self.id:
                         if _inbetween(x.id, self.id, self.successor.id):
                             self.successor = x
+                            self._topology_changed()
                         self.successor.notify(self.ref)
+                    self._update_successors()
+                else:
+                    self.successors = [self.ref]
             except Exception as e:
                 logging.error(f"Error in stabilize: {e}")
 
-            logging.info(f"(NODE_CON) successor : {self.successor} predecessor {self.predecessor}, {self.predecessor2},"
-                         f"{self.predecessor3}")
+            logging.info(f"(NODE_CON) successors: {self.successors} predecessors: {self.predecessors}")
 
             if self.id >= self.successor.id:
+                if not self.leader:
+                    threading.Thread(target=self._load_catalog, daemon=True).start()
                 self.leader = True
                 self.leader_ref = ChordNodeReference(self.ip, self.port)
                 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -246,9 +533,48 @@ class ChordNode:
             pass
         if not self.predecessor or _inbetween(node.id, self.predecessor.id, self.id):
             self.predecessor = node
-            logging.info(f"predecessor {self.predecessor}, {self.predecessor.predecessor} ")
-            self.predecessor2 = self.predecessor.predecessor
-            self.predecessor3 = self.predecessor2.predecessor if self.predecessor2 else None
+            self._topology_changed()
+            self._update_predecessors()
+            logging.info(f"predecessors {self.predecessors}")
+
+    # Successor list: the successor followed by the first nodes of its own successor list
+    def _update_successors(self):
+        nodes = [self.successor]
+        for node in self.successor.get_successors():
+            if len(nodes) >= self.replication_factor or node.id == self.id:
+                break
+            if node.id not in [n.id for n in nodes]:
+                nodes.append(node)
+        if [n.id for n in nodes] != [n.id for n in self.successors]:
+            self.successors = nodes
+            self.replica_cache.invalidate()
+            self.replication_event.set()
+
+    # The successor failed, move on to the next live node of the successor list
+    def _replace_successor(self):
+        logging.info(f'successor {self.successor} is dead')
+        for node in self.successors[1:]:
+            if node.id == self.id:
+                break
+            if node.check():
+                self.successor = node
+                self.successor.notify(self.ref)
+                break
+        else:
+            self.successor = self.ref
+        self.successors = [self.successor]
+        self._topology_changed()
+
+    # Walk back from the predecessor to find the nodes whose data this node replicates
+    def _update_predecessors(self):
+        nodes = []
+        node = self.predecessor
+        while node and node.id != self.id and len(nodes) < self.replication_factor - 1:
+            if node.id in [n.id for n in nodes]:
+                break
+            nodes.append(node)
+            node = node.predecessor
+        self.predecessors = nodes
 
     # Fix fingers method to periodically update the finger table
     def fix_fingers(self):
@@ -257,7 +583,7 @@ class ChordNode:
                 self.next += 1
                 if self.next >= self.m:
                     self.next = 0
-                suc = self.find_successor((self.id + 2 ** self.next) % 2 ** self.m)
+                suc = self.find_successor((self.id + 2 ** self.next) % 2 ** self.m, use_cache=False)
                 if suc:
                     self.finger[self.next] = suc
 
@@ -265,325 +591,949 @@ class ChordNode:
                 logging.error(f"Error in fix_fingers: {e}")
             time.sleep(5)
 
-    def dist_data(self, data: dict):
+    # Take over the data of a failed predecessor from its local replica
+    def dist_data(self, data: KeyStore):
         if not data:
             return
-        logging.info(f'dist_data {self.data}')
-        for key, value in list(data.items()):
-            self.data[key] = value
+        logging.debug(f'dist_data: {len(data)} keys')
+        self.data.update(data.to_dict())
+        self._data_changed()
 
     # Check predecessor method to periodically verify if the predecessor is alive
     def check_predecessor(self):
         while True:
             try:
-                # A --- B --- C --- D
                 logging.info(f'pred: {self.predecessor}')
-
                 if self.predecessor:
-
                     resp = self.predecessor.check()
                     logging.info(f'resp from: {self.predecessor} is {resp}')
-                    if resp == b'':
-                        logging.info('pred1 is dead')
-                        self.dist_data(self.pred_data)
-                        if self.predecessor2.id == self.id:
-                            self.predecessor = None
-                            self.predecessor2 = None
-                            self.predecessor3 = None
-                            self.successor = self.ref
-                            continue
-
-                        resp = self.predecessor2.check()
-                        if resp == b'':
-                            logging.info(f'pred2 is dead pred3: {self.predecessor3}')
-                            self.dist_data(self.pred2_data)
-                            if self.predecessor3:
-                                if self.predecessor3.id == self.id:
-                                    self.predecessor = None
-                                    self.predecessor2 = None
-                                    self.predecessor3 = None
-                                    self.successor = self.ref
-                                    continue
-                                else:
-                                    logging.info('Connect with predecessor3')
-                                    self.predecessor = self.predecessor3
-                                    self.predecessor.update_successor(self.ref)
-                                    self.successor = self.predecessor
-                                    self.predecessor2 = self.predecessor.predecessor
-                                    self.predecessor3 = self.predecessor2.predecessor if self.predecessor2 else None
-                            else:
-                                self.send_broadcast_join()
-
-                        else:
-                            logging.info(f'new pred : {self.predecessor}')
-                            self.predecessor = self.predecessor2
-                            self.predecessor.update_successor(self.ref)
-
-                    self.predecessor2 = self.predecessor.predecessor
-                    self.predecessor3 = self.predecessor2.predecessor if self.predecessor2 else None
-
+                    if not resp:
+                        self._recover_predecessors()
+                    if self.predecessor:
+                        self._update_predecessors()
             except Exception as e:
                 logging.error(f"Error in check_predecessor: {e}")
                 self.predecessor = None
+                self._topology_changed()
             time.sleep(5)
 
-    # Store key method to store a key-value pair and replicate to the successor
-    def store_key(self, key: str, value: str):
+    # The predecessor failed: take over the data of every failed node before this one from
+    # the replicas and reconnect with the nearest live predecessor
+    def _recover_predecessors(self):
+        self._topology_changed()
+        dead = 0
+        alive = None
+        for node in self.predecessors or [self.predecessor]:
+            if node.id == self.id:
+                break
+            if dead and node.check():
+                alive = node
+                break
+            logging.info(f'predecessor {node} is dead')
+            self.dist_data(self.replicas.pop(node.id, None))
+            dead += 1
+
+        if alive:
+            logging.info(f'new pred : {alive}')
+            self.predecessor = alive
+            self.predecessor.update_successor(self.ref)
+            return
+        self.predecessor = None
+        self.predecessors = []
+        if dead >= self.replication_factor - 1:
+            # More nodes failed in a row than there are replicas, rejoin the ring from scratch
+            self.send_broadcast_join()
+        elif any(node.id != self.id and node.check() for node in self.successors):
+            # The ring goes on past the failed nodes, the live node before them notifies this one
+            logging.info('every predecessor is dead, waiting for a notify')
+        else:
+            # Every other node of the ring failed
+            self.successor = self.ref
+            self.successors = [self.ref]
+
+    # Store key method to store a key-value pair in its owner, which replicates it to its successors
+    def store_key(self, key: str, value) -> bool:
         key_hash = hash_function(key, self.m)
         node = self.find_successor(key_hash)
         logging.info(f'STORE KEY {key} IN {node}')
-        node.store_key(key, value)
-        # self.data[key] = value  # Store in the current node
-        # self.successor.store_key(key, value)  # Replicate to the successor
+        return node is not None and node.store_key(key, value)
 
-    # Retrieve key method to get a value for a given key
-    def retrieve_key(self, key: str) -> str:
+    # Retrieve key method to get a value for a given key, from any of its copies when allowed
+    def retrieve_key(self, key: str, any_replica: bool = False):
         key_hash = hash_function(key, self.m)
         node = self.find_successor(key_hash)
+        if node is None:
+            return None
+        if any_replica and self.replication_factor > 1:
+            replica = random.choice(self.find_replicas(node))
+            if replica.id != node.id:
+                resp = replica.retrieve_key(key)
+                # A replica that lags behind may not have the key yet
+                if resp is not None:
+                    return resp
         return node.retrieve_key(key)
 
+    # Nodes holding a copy of the data owned by node: the node and its first successors
+    def find_replicas(self, node: 'ChordNodeReference') -> list:
+        replicas = self.replica_cache.get(node.id)
+        if replicas is None:
+            replicas = [node] + [n for n in node.get_successors() if n.id != node.id]
+            replicas = replicas[:self.replication_factor]
+            self.replica_cache.put(node.id, replicas)
+        return replicas
+
+    # Store a key in local data, waiting for the write quorum of copies when it is above one
+    def put_local(self, key: str, value) -> bool:
+        self.data[key] = value
+        self._data_changed()
+        if self.write_quorum <= 1:
+            return True
+        targets = self._replica_targets()
+        needed = min(self.write_quorum, len(targets) + 1) - 1
+        return self.push_replicas(targets, needed) >= needed
+
+    # Pull the changes made on the predecessors since the last sync, and periodically
+    # compare digests to repair replicas that diverged anyway
     def get_data_from_predecessors(self):
+        last_check = 0
         while True:
+            check = time.monotonic() - last_check >= ANTI_ENTROPY_INTERVAL
             try:
-                if self.predecessor and self.predecessor.id != self.id:
-                    _pred_data = self.predecessor.send_data().decode()
-                    logging.info(f'Saving pred data {_pred_data}')
-
-                    _pred_data = json.loads(_pred_data)
-
-                    if _pred_data:
-                        self.pred_data = _pred_data
-
-                if self.predecessor2 and self.predecessor2.id != self.id:
-                    _pred2_data = self.predecessor2.send_data().decode()
-                    logging.info(f'Saving pred2 data {_pred2_data}')
-
-                    _pred2_data = json.loads(_pred2_data)
-                    if _pred2_data:
-                        self.pred2_data = _pred2_data
+                owners = [node for node in self.predecessors if node.id != self.id]
+                for node in owners:
+                    self._sync_replica(node, check)
+                # Nodes that are not among the predecessors anymore are replicated by others
+                for owner in list(self.replicas):
+                    if owner not in [node.id for node in owners]:
+                        self.replicas.pop(owner, None)
+                if check:
+                    last_check = time.monotonic()
             except Exception as e:
                 logging.info(f'Error in get_data_from_predecessors {e}')
 
-            logging.info(f'pred: {self.pred_data}, pred2: {self.pred2_data}')
-            time.sleep(8)
-
-    def update_tournament_sim(self, name, data):
-
-        tournament_data = self.retrieve_key(name)
-        tournament_data = json.loads(tournament_data)
-        logging.info(f'UPDATE TOURNAMENT SIM {tournament_data}')
-        player_name = list(data['winner'].keys())[0]
-        player_l = list(data['l'].keys())[0]
-        score = data['winner'][player_name] + 1
-        key = f'{player_name}-{player_l}-{tournament_data['round']}'
-        if 'history' not in tournament_data:
-            tournament_data['history'] = [key]
-        else:
-            if key not in tournament_data['history']:
-                tournament_data['history'].append(key)
+            logging.info(f'replicas: {self.replicas}')
+            time.sleep(REPLICA_SYNC_INTERVAL)
+
+    def _replica_store(self, owner: int) -> KeyStore:
+        store = self.replicas.get(owner)
+        if store is None:
+            store = KeyStore(self.m)
+            store.owner = owner
+            store = self.replicas.setdefault(owner, store)
+        return store
+
+    def _sync_replica(self, node: 'ChordNodeReference', anti_entropy: bool):
+        store = self._replica_store(node.id)
+        delta = node.send_data(store.synced_epoch, store.synced_seq)
+        if delta:
+            store.apply_delta(delta)
+        if anti_entropy:
+            digest = node.digest()
+            for bucket, value in enumerate(digest or []):
+                if value != store.digests[bucket]:
+                    start, end = store.bucket_range(bucket)
+                    items = node.send_range(start, end)
+                    if items is not None:
+                        logging.info(f'replica of {node} diverged in ({start}, {end}], repairing')
+                        store.replace_range(start, end, items)
+
+    # Called after every write to local data
+    def _data_changed(self):
+        self.replication_event.set()
+        self.watch_event.set()
+
+    # Successors that hold a replica of this node's data
+    def _replica_targets(self) -> list:
+        return [node for node in self.successors[:self.replication_factor - 1] if node.id != self.id]
+
+    # Push local writes to the replicas in the background as they happen
+    def replicate_data(self):
+        while True:
+            self.replication_event.wait()
+            self.replication_event.clear()
+            try:
+                self.push_replicas(self._replica_targets())
+            except Exception as e:
+                logging.error(f'Error in replicate_data: {e}')
+
+    # Push pending changes to every target in parallel, returns how many acknowledged them
+    # once `wait_for` did (or all of them answered)
+    def push_replicas(self, targets: list, wait_for: int = None) -> int:
+        futures = [self.replication_pool.submit(self._push_replica, node) for node in targets]
+        wait_for = len(futures) if wait_for is None else wait_for
+        acks = 0
+        for future in as_completed(futures):
+            if acks >= wait_for:
+                break
+            if future.result():
+                acks += 1
+        return acks
+
+    def _push_replica(self, node: 'ChordNodeReference') -> bool:
+        with self.push_locks.setdefault(node.id, threading.Lock()):
+            # With no acknowledged version yet, probe with an empty delta to learn where the replica is
+            epoch, since = self.pushed.get(node.id, (self.data.epoch, self.data.seq))
+            delta = self.data.changes_since(epoch, since)
+            if node.id in self.pushed and not (delta['full'] or delta['items'] or delta['deleted']):
+                return True
+            state = node.replicate(self.id, since, delta)
+            if state and (state['epoch'] != delta['epoch'] or state['seq'] < delta['seq']):
+                # The replica is behind the version the delta starts from, send what it misses
+                delta = self.data.changes_since(state['epoch'], state['seq'])
+                state = node.replicate(self.id, state['seq'], delta)
+            if not state or state['epoch'] != delta['epoch'] or state['seq'] < delta['seq']:
+                return False
+            self.pushed[node.id] = (delta['epoch'], delta['seq'])
+            return True
+
+    # Apply a pushed delta if the replica is in sync with the version it starts from, and
+    # report which version the replica is at
+    def apply_replica(self, owner: int, since: int, delta: dict) -> dict:
+        store = self._replica_store(owner)
+        if delta['full'] or (store.synced_epoch == delta['epoch'] and store.synced_seq >= since):
+            store.apply_delta(delta)
+        return {'epoch': store.synced_epoch, 'seq': store.synced_seq}
+
+    # Send a game result to the tournament's owner, which applies it
+    def update_tournament_sim(self, name, data) -> bool:
+        for attempt in range(RESULT_RETRIES):
+            node = self.find_successor(hash_function(name, self.m), use_cache=attempt == 0)
+            if node is None:
+                ok = False
+            elif node.id == self.id:
+                ok = self.append_result(name, data)
+            else:
+                ok = node.append_result(name, data)
+            if ok:
+                return True
+        logging.error(f'result of {name} could not be stored: {data}')
+        return False
+
+    # Queue a result of an owned tournament and wait until the batch holding it is stored
+    def append_result(self, name: str, data: dict) -> bool:
+        with self.result_lock:
+            batch = self.result_batches.get(name)
+            if batch is None:
+                batch = self.result_batches[name] = {'results': [], 'done': threading.Event(), 'ok': False}
+            batch['results'].append(data)
+        self.result_event.set()
+        batch['done'].wait(RESULT_TIMEOUT)
+        return batch['ok']
+
+    # Apply queued results in batches, one write of each tournament per batch
+    def aggregate_results(self):
+        while True:
+            self.result_event.wait()
+            time.sleep(RESULT_BATCH_DELAY)  # Let results of the same round pile up
+            self.result_event.clear()
+            with self.result_lock:
+                batches, self.result_batches = self.result_batches, {}
+            for name, batch in batches.items():
+                try:
+                    batch['ok'] = self._apply_results(name, batch['results'])
+                except Exception as e:
+                    logging.error(f'Error applying results of {name}: {e}')
+                finally:
+                    batch['done'].set()
+
+    def _apply_results(self, name: str, results: list) -> bool:
+        with self.tournament_locks.setdefault(name, threading.Lock()):
+            document = self.data.get(name)
+            if document is None:
+                # Not the owner (anymore)
+                self.tournament_states.pop(name, None)
+                return False
+            cached = self.tournament_states.get(name)
+            # The parsed state is reused as long as nobody stored another document meanwhile
+            state = cached[1] if cached and cached[0] is document else TournamentState.from_dict(document)
+            recorded = [state.record(data) for data in results]
+            logging.info(f'UPDATE TOURNAMENT SIM {name}: {sum(recorded)} of {len(results)} results recorded')
+            if any(recorded):
+                document = state.to_dict()
+                ok = self.put_local(name, document)
+                self.tournament_states[name] = (document, state)
             else:
+                ok = True
+            finished = any(recorded) and state.temp == 0
+            round = state.round
+        self._games_finished(name, results)
+        self._publish(name, [{'type': 'game_result', 'round': data.get('round'), 'winner': next(iter(data['winner'])),
+                              'loser': next(iter(data['l'])), 'draw': data.get('draw', False)}
+                             for data, ok in zip(results, recorded) if ok])
+        if finished:
+            threading.Thread(target=self._simulate, args=(name, round), daemon=True).start()
+        return ok
+
+    # Tell the scheduler which games are over, and drop the copies still running elsewhere
+    def _games_finished(self, name: str, results: list):
+        for data in results:
+            if 'key' not in data:
+                continue
+            nodes = self.scheduler.finished(f"{name}-{data.get('round')}", data['key'])
+            if len(nodes) > 1:
+                for node in nodes:
+                    self.dispatch_pool.submit(node.cancel_games, [data['key']])
+
+    # Start the tournament's next round, on its owner, which the results are sent to. Given the
+    # round that just ended, nothing is done if another coordinator moved past it already.
+    def _simulate(self, tournament_name, round=None):
+        logging.info(f'COORDINATE TOURNAMENT {self.id} IN NODE: {self.id}')
+        node = self.find_successor(hash_function(tournament_name, self.m))
+        if node is None:
+            logging.error(f'owner of {tournament_name} not found, round delayed')
+            self._retry_simulate(tournament_name, round)
+            return
+        if node.id != self.id:
+            node.simulate(tournament_name)
+            return
+        with self.tournament_locks.setdefault(tournament_name, threading.Lock()):
+            tournament_data = self.data.get(tournament_name)
+            if tournament_data is None:
+                logging.error(f'tournament {tournament_name} not found')
+                return
+            if tournament_data.get('completed') or tournament_data.get('temp', 0) > 0:
+                return
+            if round is not None and tournament_data.get('round') != round:
+                return
+            tournament_data = copy.deepcopy(tournament_data)
+            if not self._store_player_codes(tournament_data):
+                # Games would go out without the code of some player, try again later
+                logging.error(f'code of a player of {tournament_name} could not be stored, round delayed')
+                self._retry_simulate(tournament_name, round)
+                return
+            plan = TournamentSimulator.next_round(tournament_data)
+            if plan is None:
+                tournament_data['winner'] = TournamentSimulator.winner(tournament_data)
+                tournament_data['completed'] = True
+                tournament_data.pop('round_seed', None)
+                self.put_local(tournament_name, tournament_data)
+                self._publish(tournament_name, [{'type': 'winner', 'winner': tournament_data['winner']}])
                 return
 
-        for player in tournament_data['players']:
-            if player['name'] == player_name and player['score'] < score:
-                player['score'] = score
-                player['next_round'] = True
-                player['active'] = False
-            elif player['name'] == player_l:
-                player['active'] = False
-                player['next_round'] = False
-
-        tournament_data['games'].append(f'{player_name} vs {player_l}')
-        tournament_data['temp'] -= 1
-        self.store_key(name, tournament_data)
-        if tournament_data['temp'] == 0:
-            self._simulate(name)
-
-    def _simulate(self, tournament_name):
-        logging.info(f'COORDINATE TOURNAMENT {self.id} IN NODE: {self.id}')
+            # The round's seed is stored with it, so another node can draw it again to take it over
+            size, games = plan
+            tournament_data['temp'] = size
+            self.coordinating.add(f"{tournament_name}-{tournament_data['round']}")
+            self.put_local(tournament_name, tournament_data)
+        self._publish(tournament_name, [{'type': 'round_advanced', 'round': tournament_data['round'], 'games': size}])
+        self._dispatch_round(tournament_name, tournament_data, games)
+
+    # Start the round again once ROUND_CHECK_INTERVAL seconds passed
+    def _retry_simulate(self, tournament_name, round=None):
+        retry = threading.Timer(ROUND_CHECK_INTERVAL, self._simulate, args=(tournament_name, round))
+        retry.daemon = True
+        retry.start()
+
+    # Take over a round left without a coordinator: its games without a result are run again,
+    # except the ones whose lease has not run out yet, which may still come in
+    def _resume_round(self, tournament_name: str):
         node = self.find_successor(hash_function(tournament_name, self.m))
-        tournament_data = node.retrieve_key(tournament_name)
-        tournament_data = json.loads(tournament_data)
-        players = tournament_data['players']
-        ttype = tournament_data['type']
-        games = TournamentSimulator.generate_games(players, ttype)
-        if len(games) == 0:
-            for player in tournament_data['players']:
-                if player.get('next_round', False):
-                    tournament_data['winner'] = player['name']
-                    tournament_data['completed'] = True
-                    self.store_key(tournament_name, tournament_data)
+        if node is None or node.id != self.id:
+            return
+        with self.tournament_locks.setdefault(tournament_name, threading.Lock()):
+            tournament_data = self.data.get(tournament_name)
+            if tournament_data is None or tournament_data.get('completed') or 'round_seed' not in tournament_data:
+                return
+            group = f"{tournament_name}-{tournament_data.get('round')}"
+            if group in self.coordinating:
+                return
+            self.coordinating.add(group)
+            tournament_data = copy.deepcopy(tournament_data)
+        round = tournament_data.get('round')
+        saved = self.get(LEASE_PREFIX + tournament_name, for_update=True)
+        leases = saved['leases'] if saved.get('round') == round else {}
+        logging.info(f"taking over round {round} of {tournament_name}, {tournament_data.get('temp')} games "
+                     f"without a result, {len(leases)} leased")
+        self._dispatch_round(tournament_name, tournament_data, TournamentSimulator.round_games(tournament_data), leases)
+
+    # Resume the owned rounds nobody coordinates, after their owner failed or this node took
+    # their keys over
+    def watch_rounds(self):
+        while True:
+            time.sleep(ROUND_CHECK_INTERVAL)
+            try:
+                for name, document in self.data.items():
+                    if not isinstance(document, dict) or document.get('completed') or 'round_seed' not in document:
+                        continue
+                    if f"{name}-{document.get('round')}" in self.coordinating:
+                        continue
+                    if document.get('temp', 0) > 0:
+                        threading.Thread(target=self._resume_round, args=(name,), daemon=True).start()
+                    else:
+                        # Every result is in but the next round was never started
+                        threading.Thread(target=self._simulate, args=(name, document.get('round')),
+                                         daemon=True).start()
+            except Exception as e:
+                logging.error(f'Error in watch_rounds: {e}')
+
+    # Run the games of a round on the nodes with free workers until every result is in.
+    # Games are taken from the round as the nodes have room for them, leases taken over from
+    # a previous coordinator are kept until they run out.
+    def _dispatch_round(self, tournament_name: str, tournament_data: dict, games, leases: dict = None):
+        start = time.monotonic()
+        round = tournament_data.get('round')
+        # Game nodes only need the match settings, games carry the hashes of their players' code
+        context = {k: v for k, v in tournament_data.items()
+                   if k not in ('players', 'results', 'games', 'history')}
+        context['name'] = tournament_name
+        group = f'{tournament_name}-{round}'
+        leases = leases or {}
+        games = iter(games)
+        streamed = 0
+        exhausted = False
+        saved = time.monotonic()
+        counters = ('speculated', 'recovered', 'stolen', 'expired')
+        before = {counter: getattr(self.scheduler, counter) for counter in counters}
+        started = set()  # Keys of the games announced as started
+        try:
+            while True:
+                document = self.data.get(tournament_name)
+                if document is None or document.get('round') != round:
+                    logging.info(f'round {round} of {tournament_name} is no longer coordinated here')
                     return
-
-        if 'round' not in tournament_data:
-            tournament_data['round'] = 1
+                self._poll_loads(not exhausted or self.scheduler.pending(group))
+                room = self.scheduler.capacity()
+                while not exhausted and room > 0:
+                    game = next(games, None)
+                    if game is None:
+                        exhausted = True
+                        break
+                    key = TournamentSimulator.game_key(context, game)
+                    lease = leases.get(key)
+                    self.scheduler.add(group, key, game, lease)
+                    streamed += 1
+                    if not lease:
+                        room -= 1
+                if exhausted and self.scheduler.done(group):
+                    break
+                events = []
+                for key, game in self._send_games(group, context, self.scheduler.schedule(group)):
+                    # Copies sent again or as a backup were announced already
+                    if key not in started:
+                        started.add(key)
+                        events.append({'type': 'game_started', 'round': round,
+                                       'players': [next(iter(game['player1'])), next(iter(game['player2']))]})
+                self._publish(tournament_name, events)
+                for node_id, node, count in self.scheduler.steal_plan(group):
+                    keys = (self if node_id == self.id else node).steal_games(group, count)
+                    if keys:
+                        logging.info(f'took back {len(keys)} queued games of {group} from {node}')
+                        self.scheduler.released(group, keys, node_id)
+                if time.monotonic() - saved >= LEASE_SYNC_INTERVAL:
+                    saved = time.monotonic()
+                    self._save_leases(tournament_name, group)
+                self.scheduler.wait(group, SCHEDULE_INTERVAL)
+        finally:
+            self.scheduler.drop(group)
+            self.coordinating.discard(group)
+            self.saved_leases.pop(group, None)
+        elapsed = time.monotonic() - start
+        self.metrics['dispatch'] = {'tournament': tournament_name, 'round': round, 'games': streamed,
+                                    'seconds': elapsed, 'games_per_second': streamed / elapsed if elapsed else 0,
+                                    **{counter: getattr(self.scheduler, counter) - before[counter]
+                                       for counter in counters}}
+        logging.info(f'round {round} of {tournament_name}: {streamed} games in {elapsed * 1000:.1f} ms')
+
+    # Store the round's lease table under its own key, for whoever coordinates the round next.
+    # It is only written when a lease or a checkpoint changed since the last time.
+    def _save_leases(self, tournament_name: str, group: str):
+        document = self.data.get(tournament_name)
+        if document is None or f"{tournament_name}-{document.get('round')}" != group:
+            return
+        leases = self.scheduler.leases(group)
+        if leases == self.saved_leases.get(group, {}):
+            return
+        if self.store_key(LEASE_PREFIX + tournament_name, {'round': document.get('round'), 'leases': leases}):
+            self.saved_leases[group] = leases
+
+    # Nodes games can run on: this one and every node it knows of
+    def _game_nodes(self) -> dict:
+        nodes = {self.id: self}
+        for node in self.successors + self.predecessors + self.finger:
+            if node and node.id not in nodes:
+                nodes[node.id] = node
+        return nodes
+
+    # Ask every node for its load at once. A node still to answer a previous request, or that
+    # takes over LOAD_TIMEOUT, is left out of this schedule. Polls are shared by the rounds
+    # coordinated here and spaced out by LOAD_POLL_INTERVAL, LOAD_IDLE_INTERVAL when no round
+    # has games to place (pending).
+    def _poll_loads(self, pending: bool = True):
+        with self.load_lock:
+            now = time.monotonic()
+            if now - self.loads_polled < (LOAD_POLL_INTERVAL if pending else LOAD_IDLE_INTERVAL):
+                return
+            self.loads_polled = now
+        polls = {}
+        for node_id, node in self._game_nodes().items():
+            if node_id == self.id:
+                continue
+            future = self.load_polls.get(node_id)
+            if future is None or future.done():
+                future = self.load_polls[node_id] = self.dispatch_pool.submit(node.game_load)
+            polls[node_id] = (node, future)
+        wait([future for _, future in polls.values()], timeout=LOAD_TIMEOUT)
+        loads = {self.id: (self, self.game_load())}
+        for node_id, (node, future) in polls.items():
+            loads[node_id] = (node, future.result() if future.done() and not future.exception() else None)
+        self.scheduler.refresh(loads)
+
+    # One RUN_GAMES request per node, all in flight together, games a node did not take are
+    # scheduled again. Returns the (key, game) the nodes took.
+    def _send_games(self, group: str, tournament: dict, batches: dict) -> list:
+        futures = {}
+        accepted = []
+        for node_id, (node, games) in batches.items():
+            for i in range(0, len(games), DISPATCH_BATCH):
+                chunk = games[i:i + DISPATCH_BATCH]
+                future = self.dispatch_pool.submit(node.run_games, tournament, [game for _, game in chunk])
+                futures[future] = (node_id, chunk)
+        for future in as_completed(futures):
+            node_id, chunk = futures[future]
+            try:
+                answers = future.result()
+            except Exception as e:
+                logging.error(f'Error dispatching games: {e}')
+                answers = []
+            rejected = [key for i, (key, _) in enumerate(chunk) if i >= len(answers) or not answers[i]]
+            if rejected:
+                self.scheduler.rejected(group, rejected, node_id)
+            accepted += [item for i, item in enumerate(chunk) if i < len(answers) and answers[i]]
+        return accepted
+
+    # Queue a game on the local engine, from the match's checkpoint if it has one. False when it
+    # is full or the code of a player could not be fetched, the game is then sent again later.
+    # Once the code could not be fetched CODE_FETCH_RETRIES times, its player loses the game.
+    def run_game(self, tournament, game) -> bool:
+        key = TournamentSimulator.game_key(tournament, game)
+        self.fetch_codes(game.get('codes', ()))
+        codes = TournamentSimulator.game_codes(game)
+        if None in codes:
+            misses = self.code_misses[key] = self.code_misses.get(key, 0) + 1
+            if misses < CODE_FETCH_RETRIES:
+                logging.error(f"code of a player of {key} is missing, game not taken")
+                return False
+            del self.code_misses[key]
+            logging.error(f"code of a player of {key} is missing after {misses} tries, the player loses")
+            self.dispatch_pool.submit(TournamentSimulator.finish_game, tournament, game,
+                                      {'failed': codes.index(None), 'error': 'missing code'}, self)
+            return True
+        self.code_misses.pop(key, None)
+        return self.engine.submit(key, codes,
+                                  lambda _, result: TournamentSimulator.finish_game(tournament, game, result, self),
+                                  cost=TournamentSimulator.match_cost(tournament),
+                                  group=f"{tournament['name']}-{tournament.get('round')}",
+                                  checkpoint=game.get('checkpoint'),
+                                  progress=lambda key, checkpoint: self.dispatch_pool.submit(
+                                      self._report_progress, tournament, key, checkpoint),
+                                  **TournamentSimulator.match_options(tournament))
+
+    # Send the progress of a match to the owner of its tournament, which extends its lease
+    def _report_progress(self, tournament: dict, key: str, checkpoint: dict):
+        node = self.find_successor(hash_function(tournament['name'], self.m))
+        group = f"{tournament['name']}-{tournament.get('round')}"
+        if node is None:
+            # The lease is renewed by the next report
+            return
+        if node.id == self.id:
+            self.checkpoint(group, key, checkpoint)
         else:
-            tournament_data['round'] += 1
-        tournament_data['temp'] = len(games)
-        self.store_key(tournament_name, tournament_data)
-        for game in games:
-            key = f'{tournament_name}-{list(game['player1'].keys())[0]}-{list(game['player2'].keys())[0]}'
-            key_hash = hash_function(key, self.m)
-            # find node to run game
-            node1 = self.find_successor(key_hash)
-            node2 = node1.successor
-            if node2 and node2.id == node1.id:
-                node2 = None
-            _game_data = json.dumps(game)
-            tournament_data.update({'name': tournament_name})
-            _tournament = json.dumps(tournament_data)
-            if node1:
-                logging.info(f'Run game in node {node1}')
-
-                node1.run_game(_tournament, _game_data)
-
-            if node2:
-                logging.info(f'Run game in node2 {node2}')
-                node2.run_game(_tournament, _game_data)
-
-            logging.info(key)
-
-    def run_game(self, tournament, game):
-        threading.Thread(target=TournamentSimulator.simulate_game,
-                         args=(tournament, game, self), daemon=True).start()
-
+            node.checkpoint(group, key, checkpoint)
+
+    def checkpoint(self, group: str, key: str, checkpoint: dict) -> bool:
+        return self.scheduler.checkpoint(group, key, checkpoint)
+
+    def run_games(self, tournament, games: list) -> list:
+        self.fetch_codes({digest for game in games for digest in game.get('codes', ()) if digest})
+        return [self.run_game(tournament, game) for game in games]
+
+    # Store player code once under its content hash, returns the hash or None if it was not stored
+    def store_code(self, code: str):
+        digest = player_cache.put_code(code)
+        if not self.store_key(CODE_PREFIX + digest, {'code': code}):
+            return None
+        return digest
+
+    # Bring the code of the given hashes missing from the local cache in from the code store
+    def fetch_codes(self, digests):
+        for digest in digests:
+            if not digest or player_cache.get_code(digest) is not None:
+                continue
+            value = self.retrieve_key(CODE_PREFIX + digest, any_replica=self.read_from_replicas)
+            if not value or player_cache.digest(value['code']) != digest:
+                logging.error(f'code {digest} not found in the code store')
+                continue
+            player_cache.put_code(value['code'])
+
+    # Move the code of players added with it inline to the code store, once per tournament.
+    # False if some could not be stored.
+    def _store_player_codes(self, tournament: dict) -> bool:
+        stored = True
+        for player in tournament['players']:
+            if player.get('code') is not None and not player.get('code_hash'):
+                digest = self.store_code(player['code'])
+                if digest:
+                    player['code_hash'] = digest
+                    del player['code']
+                else:
+                    stored = False
+        return stored
+
+    def game_load(self) -> dict:
+        return self.engine.load()
+
+    def steal_games(self, group: str, count: int) -> list:
+        return self.engine.steal(group, count)
+
+    def cancel_games(self, keys: list) -> bool:
+        for key in keys:
+            self.engine.cancel(key)
+        return True
+
+    # Rounds run until all their results are in, the tournament is coordinated in the background
     def simulate_tournament(self, tournament_name):
-        node = ChordNodeReference(self.leader_ref.ip, self.leader_ref.port)
-        return self._simulate(tournament_name)
+        threading.Thread(target=self._simulate, args=(tournament_name,), daemon=True).start()
 
     def send(self, id, data):
         if data:
-            _data = json.dumps(data)
-            self.store_key(id, _data)
-            logging.info(f'{hash_function(id, self.m)}: {data} saved')
-
-    def get(self, id):
+            self.document_cache.invalidate([id])
+            self.store_key(id, data)
+            logging.debug(f'{hash_function(id, self.m)}: {id} saved')
+
+    # Read a document, from any of its copies when read_from_replicas is set. Reads of a
+    # document that is then modified and written back go to its owner only (for_update), a
+    # replica that lags behind would make the write undo newer changes.
+    def get(self, id, for_update: bool = False):
         try:
-            return self.retrieve_key(id)
+            resp = self.retrieve_key(id, any_replica=self.read_from_replicas and not for_update)
+            return resp if resp is not None else {}
         except Exception as e:
             logging.error(f'Error in get {id}: {e}')
             return {}
 
-    def update_data(self):
+    # Add events to the log of an owned tournament and push them to the nodes subscribed to
+    # it. Nothing is kept for tournaments nobody follows.
+    def _publish(self, name: str, events: list):
+        if not events:
+            return
+        now = time.monotonic()
+        with self.event_lock:
+            log = self.event_logs.get(name)
+            if log is None:
+                return
+            subscribers = self.subscribers.get(name, {})
+            for subscriber, until in list(subscribers.items()):
+                if until <= now:
+                    del subscribers[subscriber]
+            delta = log.append(events)
+        for ip, port in subscribers:
+            self.dispatch_pool.submit(ChordNodeReference(ip, port).push_events, name, delta)
+
+    # Owner side of a subscription: the node at ip:port gets the tournament's events for the
+    # next SUBSCRIBE_TIME seconds, and the ones after (epoch, since) right away. Logs left
+    # without subscribers are dropped.
+    def subscribe_events(self, name: str, ip: str, port: int, epoch: str = None, since: int = 0) -> dict:
+        if name not in self.data:
+            return None
+        now = time.monotonic()
+        with self.event_lock:
+            for other, subscribers in list(self.subscribers.items()):
+                if other != name and all(until <= now for until in subscribers.values()):
+                    del self.subscribers[other]
+                    self.event_logs.pop(other, None)
+            log = self.event_logs.setdefault(name, EventLog())
+            self.subscribers.setdefault(name, {})[(ip, port)] = now + SUBSCRIBE_TIME
+        return log.since(epoch, since)
+
+    # Events pushed by a tournament's owner. When some are missing the feed pulls them.
+    def receive_events(self, name: str, delta: dict) -> bool:
+        feed = self.event_feeds.get(name)
+        if feed is not None and not feed.merge(delta):
+            self.dispatch_pool.submit(self._subscribe_events, name, feed)
+        return True
+
+    def _subscribe_events(self, name: str, feed: EventFeed):
+        delta = None
+        for attempt in range(2):
+            # A node that does not own the tournament may be a stale lookup, look it up again
+            node = self.find_successor(hash_function(name, self.m), use_cache=attempt == 0)
+            delta = node.subscribe_events(name, self.ip, self.port, *feed.source) if node else None
+            if delta is not None:
+                break
+        if delta is None:
+            logging.error(f'Could not subscribe to the events of {name}')
+            feed.renewed = 0
+            return
+        feed.merge(delta)
+
+    # Events of a tournament for the front end's readers, after the cursor of the last ones
+    # they got, waiting up to timeout seconds for one: {'epoch', 'events': [[seq, event]],
+    # 'cursor', 'reset'}. Every reader of a tournament shares one subscription to its owner,
+    # renewed while they keep reading.
+    def tournament_events(self, name: str, cursor: str = None, timeout: float = EVENT_WAIT) -> dict:
+        now = time.monotonic()
+        with self.event_lock:
+            feed = self.event_feeds.get(name)
+            if feed is None:
+                for other, unused in list(self.event_feeds.items()):
+                    if now - unused.used > SUBSCRIBE_TIME:
+                        del self.event_feeds[other]
+                feed = self.event_feeds[name] = EventFeed()
+            feed.used = now
+            renew = now - feed.renewed >= SUBSCRIBE_TIME / 2
+            if renew:
+                feed.renewed = now
+        if renew:
+            self._subscribe_events(name, feed)
+        epoch, since = None, 0
+        if cursor:
+            epoch, _, since = cursor.partition(':')
+            since = int(since) if since.isdigit() else 0
+        delta = feed.wait(epoch, since, timeout)
+        return {'epoch': delta['epoch'], 'events': delta['events'], 'cursor': f"{delta['epoch']}:{delta['seq']}",
+                'reset': delta['full']}
+
+    # Read a document for the front end as (version, value), from the local cache while its
+    # owner has not said it changed. Read from the owner otherwise, which then watches it for
+    # this node. The version is None when the owner could not be asked.
+    def get_cached(self, id):
+        entry = self.document_cache.get(id)
+        if entry is not None:
+            return entry
+        expires = self.document_cache.begin(id)
+        try:
+            for attempt in range(2):
+                node = self.find_successor(hash_function(id, self.m), use_cache=attempt == 0)
+                resp = node.watch_key(id, self.ip, self.port) if node else None
+                if resp:
+                    break
+        except Exception as e:
+            logging.error(f'Error watching {id}: {e}')
+            resp = None
+        if not resp or resp[0] is None:
+            self.document_cache.abort(id)
+            return None, self.get(id)
+        version, value = resp
+        self.document_cache.put(id, version, value, expires)
+        return version, value
+
+    # Owner side of get_cached: the value of a local key, and the node at ip:port is told when
+    # it changes in the next WATCH_TIME seconds. Watching before reading, a change in between
+    # is told too.
+    def watch_key(self, key: str, ip: str, port: int) -> list:
+        if key not in self.data:
+            return None
+        with self.watch_lock:
+            self.watchers.setdefault(key, {})[(ip, port)] = time.monotonic() + WATCH_TIME
+        version, value = self.data.get_versioned(key)
+        return [version, value] if version is not None else None
+
+    # Tell the nodes watching local keys that they changed, from the data's change log so
+    # every kind of write is caught. A watch is used up once told, the node watches again on
+    # its next read, so a document changing often costs one message per read of it.
+    def push_invalidations(self):
+        epoch, seq = self.data.epoch, self.data.seq
+        swept = time.monotonic()
         while True:
-            logging.info(f'my data is {self.data}')
+            self.watch_event.wait(WATCH_TIME)
+            self.watch_event.clear()
+            try:
+                delta = self.data.changes_since(epoch, seq)
+                epoch, seq = delta['epoch'], delta['seq']
+                now = time.monotonic()
+                targets = {}  # (ip, port) -> keys to tell it about
+                with self.watch_lock:
+                    if delta['full']:
+                        # Deletions are not in a full copy, any watched key may have changed
+                        changed = list(self.watchers)
+                    else:
+                        changed = [key for key in delta['items'] if key in self.watchers]
+                        changed += [key for key, _ in delta['deleted'] if key in self.watchers]
+                    for key in changed:
+                        for watcher, until in self.watchers.pop(key).items():
+                            if until > now:
+                                targets.setdefault(watcher, []).append(key)
+                    if now - swept >= WATCH_TIME:
+                        for key, watchers in list(self.watchers.items()):
+                            for watcher, until in list(watchers.items()):
+                                if until <= now:
+                                    del watchers[watcher]
+                            if not watchers:
+                                del self.watchers[key]
+                        swept = now
+                for (ip, port), keys in targets.items():
+                    self.dispatch_pool.submit(ChordNodeReference(ip, port).invalidate, keys)
+            except Exception as e:
+                logging.error(f'Error pushing invalidations: {e}')
 
+    # Flush and compact the local log, and move keys to their owners when the ring changes
+    def update_data(self):
+        last_migration = 0
+        while True:
+            changed = self.topology_event.wait(PERSIST_INTERVAL)
             try:
-                for key, value in list(self.data.items()):
-                    key_hash = hash_function(key, self.m)
-                    node = self.find_successor(key_hash)
-                    logging.info(f'update data: {key_hash} -> {node.id if node else ''}')
-
-                    if node and node.id != self.id:
-                        node.store_key(key, value)
-                        # remove from current node
-                        self.data.pop(key)
-                self.handler.create(self.id, self.data)
+                if changed or time.monotonic() - last_migration >= MIGRATION_INTERVAL:
+                    self.topology_event.clear()
+                    last_migration = time.monotonic()
+                    self.migrate_data()
+                self.handler.sync()
+                if self.handler.needs_compaction():
+                    self.handler.compact(self.data.to_dict)
             except Exception as e:
-                logging.error(f"Error in update_data")
-            time.sleep(10)
+                logging.error(f"Error in update_data: {e}")
+
+    # Send every key this node does not own to its owner, one bulk STORE_KEYS per owner
+    def migrate_data(self):
+        predecessor = self.predecessor
+        # Keys outside (predecessor, self] belong to other nodes, the whole ring if the
+        # predecessor is unknown
+        stop = predecessor.id if predecessor else self.id
+        start = self.id
+        while True:
+            # The owner of the first foreign key clockwise also owns every key up to its
+            # own id, so each owner is resolved once and gets its whole slice
+            key = self.data.first_key(start, stop)
+            if key is None:
+                return
+            node = self.find_successor(hash_function(key, self.m))
+            if not node or node.id == self.id:
+                return
+            end = node.id if _inbetween(node.id, start, stop) else stop
+            group = self.data.range_items(start, end)
+
+            logging.info(f'migrating {len(group)} keys to {node}')
+            if not node.store_keys(group):
+                return
+            for key, value in group.items():
+                # Keep keys that were overwritten while the transfer was in flight
+                if self.data.get(key) is value:
+                    self.data.pop(key)
+            self._data_changed()
+            if end == stop:
+                return
+            start = end
 
     # Start server method to handle incoming requests
     def start_server(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            logging.info(f"Server: {self.ip}:{self.port}")
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((self.ip, self.port))
-            s.listen(10)
-
-            while True:
-                conn, addr = s.accept()
-                logging.info(f'new connection from {addr}')
-                _data = conn.recv(1024).decode()
-                logging.info(f'data: {_data}')
-                data = _data.split(',')
-                data_resp = None
-                option = int(data[0])
-
-                if option == FIND_SUCCESSOR:
-                    id = int(data[1])
-                    if id and id != 'None':
-                        data_resp = self.find_successor(id)
-                elif option == FIND_PREDECESSOR:
-                    id = int(data[1])
-                    if id and id != 'None':
-                        data_resp = self.find_predecessor(id)
-                elif option == GET_SUCCESSOR:
-                    data_resp = self.successor if self.successor else self.ref
-                elif option == GET_PREDECESSOR:
-                    logging.info(f'GET_PREDECESSOR {self.predecessor} {self.ref}')
-                    data_resp = self.predecessor if self.predecessor else self.ref
-                elif option == NOTIFY:
-                    ip = data[2]
-                    if ip and ip != 'None':
-                        self.notify(ChordNodeReference(ip, self.port))
-                elif option == CHECK:
-                    conn.sendall("OK".encode())
-                    conn.close()
-                    continue
-
-                elif option == CLOSEST_PRECEDING_FINGER:
-                    id = int(data[1])
-                    if id != 'None':
-                        data_resp = self.closest_preceding_finger(id)
-                elif option == STORE_KEY:
-                    key, value = _data.split('|')
-                    value = value.replace("'", '"').replace("None", "null").replace("False", "false").replace("True",
-                                                                                                              "true")
-                    value = json.loads(value)
-                    key = key.split(',')[1]
-                    if key and value and key != 'None' and value != 'None':
-                        self.data[key] = value
-
-                elif option == RETRIEVE_KEY:
-                    key = data[1]
-                    resp = self.data.get(key, '')
-                    resp = json.dumps(resp).encode()
-                    conn.sendall(resp)
-                    conn.close()
-                    continue
-
-                elif option == UPDATE_SUCCESSOR:
-                    _ip = data[2]
-                    if _ip and _ip != 'None':
-                        self.update_successor(ChordNodeReference(_ip, self.port))
-                elif option == UPDATE_PREDECESSOR:
-                    _ip = data[2]
-                    if _ip and _ip != 'None':
-                        self.update_predecessor(ChordNodeReference(_ip, self.port))
-                elif option == SEND_DATA:
-                    # _data = {'id': self.id, 'ip': self.ip, 'port': self.port}
-                    conn.sendall(json.dumps(self.data).encode())
-                    conn.close()
-                    continue
-
-                elif option == SEND_TOURNAMENTS:
-                    resp = json.dumps(self.tournaments).encode()
-                    conn.sendall(resp)
-                    conn.close()
-                    continue
-                elif option == RUN_GAME:
-                    _game = _data.split('|')
-                    tournament_data = _game[1]
-                    game_data = _game[2]
-                    game = json.loads(game_data)
-                    tournament = json.loads(tournament_data)
-                    self.run_game(tournament, game)
-                    continue
-
-                elif option == SIMULATE_TOURNAMENT:
-                    t_name = data[1]
-                    self._simulate(t_name)
-                    continue
-
-                elif option == TOURNAMENT_RESULT:
-                    t_name, t_data = _data.split('|')
-                    t_data = json.loads(t_data)
-                    t_name = t_name.split(',')[1]
-                    self.update_tournament_sim(t_name, t_data)
-                    continue
-
-                if data_resp:
-                    response = f'{data_resp.id},{data_resp.ip}'.encode()
-                    conn.sendall(response)
-                conn.close()
+        server = RequestServer(self.ip, self.port, self._handle_request, fast_ops=FAST_OPS,
+                               workers=self.workers, backlog=self.backlog, max_pending=self.max_pending,
+                               max_message_size=self.max_message_size)
+        server.serve_forever()
+
+    # Requests arrive decoded by the server, node references travel as [id, ip]
+    def _handle_request(self, option: int, data):
+        # Payloads may hold whole tournaments and player code, only their key is logged
+        key = data[0] if isinstance(data, list) and data else data
+        logging.debug('op: %s key: %s', option, key if isinstance(key, (str, int)) else None)
+        data_resp = None
+
+        if option == FIND_SUCCESSOR:
+            data_resp = self.find_successor(data)
+        elif option == FIND_PREDECESSOR:
+            data_resp = self.find_predecessor(data)
+        elif option == LOOKUP:
+            found, node = self.next_hop(data)
+            return [found, [node.id, node.ip]]
+        elif option == GET_SUCCESSOR:
+            data_resp = self.successor if self.successor else self.ref
+        elif option == GET_PREDECESSOR:
+            logging.info(f'GET_PREDECESSOR {self.predecessor} {self.ref}')
+            data_resp = self.predecessor if self.predecessor else self.ref
+        elif option == GET_SUCCESSORS:
+            return [[node.id, node.ip] for node in self.successors]
+        elif option == NOTIFY:
+            if data and data[1]:
+                self.notify(ChordNodeReference(data[1], self.port))
+        elif option == CHECK:
+            return True
+        elif option == CLOSEST_PRECEDING_FINGER:
+            data_resp = self.closest_preceding_finger(data)
+        elif option == STORE_KEY:
+            key, value = data
+            if isinstance(value, str):
+                # Older callers send the value already serialized
+                value = json.loads(value)
+            if key and value:
+                if not self.put_local(key, value):
+                    raise Exception(f'write quorum of {self.write_quorum} not reached for {key}')
+                return True
+        elif option == STORE_KEYS:
+            self.data.update(data)
+            self._data_changed()
+            return True
+        elif option == RETRIEVE_KEY:
+            resp = self.data.get(data)
+            if resp is None:
+                # Served as a replica of the key's owner
+                for store in list(self.replicas.values()):
+                    if data in store:
+                        resp = store.get(data)
+                        break
+            return resp
+        elif option == UPDATE_SUCCESSOR:
+            if data and data[1]:
+                self.update_successor(ChordNodeReference(data[1], self.port))
+        elif option == UPDATE_PREDECESSOR:
+            if data and data[1]:
+                self.update_predecessor(ChordNodeReference(data[1], self.port))
+        elif option == SEND_DATA:
+            epoch, since = data
+            return self.data.changes_since(epoch, since)
+        elif option == REPLICATE:
+            return self.apply_replica(data['owner'], data['since'], data['delta'])
+        elif option == DIGEST:
+            return self.data.digests
+        elif option == SEND_RANGE:
+            return self.data.range_snapshot(*data)
+        elif option == SEND_TOURNAMENTS:
+            return self.catalog.completed()
+        elif option == WATCH_KEY:
+            key, ip, port = data
+            return self.watch_key(key, ip, port)
+        elif option == INVALIDATE:
+            self.document_cache.invalidate(data)
+            return True
+        elif option == SUBSCRIBE_EVENTS:
+            name, ip, port, epoch, since = data
+            return self.subscribe_events(name, ip, port, epoch, since)
+        elif option == PUSH_EVENTS:
+            name, delta = data
+            return self.receive_events(name, delta)
+        elif option == LIST_TOURNAMENTS:
+            return self.catalog.page(*data)
+        elif option == UPDATE_CATALOG:
+            key, entries = data
+            return self.update_catalog(key, entries)
+        elif option == TOURNAMENT_STATUS:
+            epoch, since = data
+            return self.tournament_status(epoch, since)
+        elif option == RUN_GAME:
+            tournament, game = data
+            if not self.run_game(tournament, game):
+                raise Busy(f'game engine of {self.ref} is full')
+            return True
+        elif option == RUN_GAMES:
+            tournament, games = data
+            return self.run_games(tournament, games)
+        elif option == GAME_LOAD:
+            return self.game_load()
+        elif option == STEAL_GAMES:
+            group, count = data
+            return self.steal_games(group, count)
+        elif option == CANCEL_GAMES:
+            return self.cancel_games(data)
+        elif option == CHECKPOINT:
+            group, key, checkpoint = data
+            return self.checkpoint(group, key, checkpoint)
+        elif option == SIMULATE_TOURNAMENT:
+            self.simulate_tournament(data)
+        elif option == TOURNAMENT_RESULT:
+            t_name, t_data = data
+            self.update_tournament_sim(t_name, t_data)
+        elif option == APPEND_RESULT:
+            t_name, t_data = data
+            return self.append_result(t_name, t_data)
+
+        if data_resp:
+            return [data_resp.id, data_resp.ip]
+        return None
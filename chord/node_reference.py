@@ -1,108 +1,183 @@
-import json
 import logging
-import time
 
 from .codes import *
-import socket
+from .codec import default_codec, get_codec
+from .transport import ConnectionPool
 from .utils import hash_function
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s')
 
+# Persistent connections shared by every reference to the same peer
+connection_pool = ConnectionPool(timeout=20)
+
 
 class ChordNodeReference:
+    codec = default_codec()  # Encoding of the requests sent, responses come back in the same one
+
     def __init__(self, ip: str, port: int = 8001, m: int = 8):
         self.id = hash_function(ip, m)
         self.ip = ip
         self.port = port
 
-    # Internal method to send data to the referenced node
-    def _send_data(self, op: int, data: str = None) -> bytes:
+    # Internal method to send data to the referenced node, returns the decoded response or
+    # None if the node failed to answer
+    def _send_data(self, op: int, data=None):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(20)
-                s.connect((self.ip, self.port))
-                logging.info(f"OP DATAAAAA{op},{data}")
-                s.sendall(f'{op},{data}'.encode('utf-8'))
-                logging.info(f"SEND ALLLLL")
-
-                response = b''
-                while True:
-                    part = s.recv(4096)
-                    if not part:
-                        break
-                    response += part
-                logging.info(f"RESPONSEEEEEEEEEEE{response}")
-                return response
+            payload = b'' if data is None else self.codec.encode(data)
+            status, flags, response = connection_pool.request((self.ip, self.port), op, payload, self.codec.id)
+            if status != STATUS_OK:
+                logging.error(f"Error response from {self} for op {op}: status {status}")
+                return None
+            return get_codec(flags).decode(response)
         except Exception as e:
             logging.error(f"Error sending data: {e}")
-            return b''
+            return None
+
+    def _node(self, response) -> 'ChordNodeReference':
+        if response:
+            return ChordNodeReference(response[1], self.port)
 
-    def send_tournaments(self):
+    def send_tournaments(self) -> dict:
         return self._send_data(SEND_TOURNAMENTS)
 
     def simulate(self, name: str):
         return self._send_data(SIMULATE_TOURNAMENT, name)
 
     def update_tournament_result(self, name, data):
-        return self._send_data(TOURNAMENT_RESULT, f'{name}|{json.dumps(data)}')
+        return self._send_data(TOURNAMENT_RESULT, [name, data])
+
+    # Method to hand a game result to the tournament's owner, True once it is stored
+    def append_result(self, name: str, data: dict) -> bool:
+        return self._send_data(APPEND_RESULT, [name, data]) is True
+
+    # Method to get the changes made on the node after a version of its data
+    def send_data(self, epoch: str = None, since: int = 0) -> dict:
+        return self._send_data(SEND_DATA, [epoch, since])
+
+    # Method to push changes of the owner's data to a replica, returns the version the replica is at
+    def replicate(self, owner: int, since: int, delta: dict) -> dict:
+        return self._send_data(REPLICATE, {'owner': owner, 'since': since, 'delta': delta})
 
-    def send_data(self):
-        return self._send_data(SEND_DATA)
+    # Method to get the digest of each ring segment of the node's data
+    def digest(self) -> list:
+        return self._send_data(DIGEST)
+
+    # Method to get the keys and versions the node holds in (start, end]
+    def send_range(self, start: int, end: int) -> dict:
+        return self._send_data(SEND_RANGE, [start, end])
 
     def update_successor(self, node: 'ChordNodeReference'):
-        self._send_data(UPDATE_SUCCESSOR, f'{node.id},{node.ip}')
+        self._send_data(UPDATE_SUCCESSOR, [node.id, node.ip])
 
     def update_predecessor(self, node: 'ChordNodeReference'):
-        self._send_data(UPDATE_PREDECESSOR, f'{node.id},{node.ip}')
+        self._send_data(UPDATE_PREDECESSOR, [node.id, node.ip])
 
     # Method to find the successor of a given id
     def find_successor(self, id: int) -> 'ChordNodeReference':
-        response = self._send_data(FIND_SUCCESSOR, str(id)).decode().split(',')
-        return ChordNodeReference(response[1], self.port)
+        return self._node(self._send_data(FIND_SUCCESSOR, id))
+
+    # Method to take one hop of a lookup: (True, successor of id) if the node knows it, else
+    # (False, next node to ask). None if the node failed to answer.
+    def next_hop(self, id: int):
+        resp = self._send_data(LOOKUP, id)
+        if resp:
+            return resp[0], self._node(resp[1])
 
     # Method to find the predecessor of a given id
     def find_predecessor(self, id: int) -> 'ChordNodeReference':
-        response = self._send_data(FIND_PREDECESSOR, str(id)).decode().split(',')
-        return ChordNodeReference(response[1], self.port)
+        return self._node(self._send_data(FIND_PREDECESSOR, id))
 
     # Property to get the successor of the current node
     @property
     def successor(self) -> 'ChordNodeReference':
-        response = self._send_data(GET_SUCCESSOR).decode().split(',')
-        if response[0] != '':
-            return ChordNodeReference(response[1], self.port)
+        return self._node(self._send_data(GET_SUCCESSOR))
 
     # Property to get the predecessor of the current node
     @property
     def predecessor(self) -> 'ChordNodeReference':
-        response = self._send_data(GET_PREDECESSOR).decode().split(',')
-        if response[0] != '':
-            return ChordNodeReference(response[1], self.port)
+        return self._node(self._send_data(GET_PREDECESSOR))
+
+    # Method to get the successor list of the current node
+    def get_successors(self) -> list:
+        return [self._node(item) for item in self._send_data(GET_SUCCESSORS) or []]
 
     # Method to notify the current node about another node
     def notify(self, node: 'ChordNodeReference'):
-        self._send_data(NOTIFY, f'{node.id},{node.ip}')
+        self._send_data(NOTIFY, [node.id, node.ip])
 
-    # Method to check if the predecessor is alive
-    def check(self):
-        return self._send_data(CHECK)
+    # Method to check if the node is alive
+    def check(self) -> bool:
+        return self._send_data(CHECK) is True
 
     # Method to find the closest preceding finger of a given id
     def closest_preceding_finger(self, id: int) -> 'ChordNodeReference':
-        response = self._send_data(CLOSEST_PRECEDING_FINGER, str(id)).decode().split(',')
-        return ChordNodeReference(response[1], self.port)
+        return self._node(self._send_data(CLOSEST_PRECEDING_FINGER, id))
 
     # Method to store a key-value pair in the current node
-    def store_key(self, key: str, value: str):
-        self._send_data(STORE_KEY, f'{key}|{value}')
-
-    # Method to retrieve a value for a given key from the current node
-    def retrieve_key(self, key: str) -> str:
-        response = self._send_data(RETRIEVE_KEY, key).decode()
-        return response
-
-    def run_game(self, tournament: str, game: str):
-        return self._send_data(RUN_GAME, f'|{tournament}|{game}')
+    def store_key(self, key: str, value) -> bool:
+        return self._send_data(STORE_KEY, [key, value]) is True
+
+    # Method to store several key-value pairs in one request, returns whether the node took them
+    def store_keys(self, items: dict) -> bool:
+        return self._send_data(STORE_KEYS, items) is True
+
+    # Method to retrieve a value for a given key from the current node, None if it is not there
+    def retrieve_key(self, key: str):
+        return self._send_data(RETRIEVE_KEY, key)
+
+    # Method to read a key from its owner as [version, value], the owner then tells the node at
+    # ip:port when the key changes. None if the node does not own the key.
+    def watch_key(self, key: str, ip: str, port: int) -> list:
+        return self._send_data(WATCH_KEY, [key, ip, port])
+
+    # Method to tell a node that read keys that they changed
+    def invalidate(self, keys: list) -> bool:
+        return self._send_data(INVALIDATE, keys) is True
+
+    # Method to subscribe the node at ip:port to the events of a tournament the node owns, returns
+    # the events after version (epoch, since) of its event log. None if it does not own it.
+    def subscribe_events(self, name: str, ip: str, port: int, epoch: str = None, since: int = 0) -> dict:
+        return self._send_data(SUBSCRIBE_EVENTS, [name, ip, port, epoch, since])
+
+    # Method to hand new events of a tournament to a node subscribed to them
+    def push_events(self, name: str, delta: dict) -> bool:
+        return self._send_data(PUSH_EVENTS, [name, delta]) is True
+
+    # Method to queue a game on the node, False if it is full or unreachable
+    def run_game(self, tournament: dict, game: dict) -> bool:
+        return self._send_data(RUN_GAME, [tournament, game]) is True
+
+    # Method to queue several games of a tournament, whether each was accepted
+    def run_games(self, tournament: dict, games: list) -> list:
+        return self._send_data(RUN_GAMES, [tournament, games]) or [False] * len(games)
+
+    # Method to get the load of the node's game engine: workers, running and queued games and their cost
+    def game_load(self) -> dict:
+        return self._send_data(GAME_LOAD)
+
+    # Method to take back up to count games of a group the node has not started, returns their keys
+    def steal_games(self, group: str, count: int) -> list:
+        return self._send_data(STEAL_GAMES, [group, count]) or []
+
+    # Method to drop games the node no longer has to run
+    def cancel_games(self, keys: list) -> bool:
+        return self._send_data(CANCEL_GAMES, keys) is True
+
+    # Method to report the progress of a match to the node coordinating its round
+    def checkpoint(self, group: str, key: str, checkpoint: dict) -> bool:
+        return self._send_data(CHECKPOINT, [group, key, checkpoint]) is True
+
+    # Method to get the changes of the node's tournament status table since a version of it
+    def tournament_status(self, epoch: str = None, since: int = 0) -> dict:
+        return self._send_data(TOURNAMENT_STATUS, [epoch, since])
+
+    # Method to get a page of the leader's tournament catalog, filtered by status and type
+    def list_tournaments(self, status: str = None, type: str = None, cursor: str = None, limit: int = None) -> dict:
+        return self._send_data(LIST_TOURNAMENTS, [status, type, cursor, limit])
+
+    # Method to write catalog entries of tournaments into the catalog shard the node owns
+    def update_catalog(self, key: str, entries: dict) -> bool:
+        return self._send_data(UPDATE_CATALOG, [key, entries]) is True
 
     def __str__(self) -> str:
         return f'({self.ip},{self.port})'
@@ -0,0 +1,343 @@
+import heapq
+import statistics
+import threading
+import time
+from collections import deque
+
+# Games a node is given past one per worker, so its workers do not idle between two schedules
+QUEUE_PER_WORKER = 2
+# A game gets a backup copy on another node once it has been out this many times the median
+# game duration, and never before SPECULATE_MIN seconds
+SPECULATE_FACTOR = 3
+SPECULATE_MIN = 2.0
+# Game durations the median is taken over
+DURATION_SAMPLES = 128
+# Seconds a node holds a game before it is given to another, unless it reports progress
+LEASE_TIME = 60
+# Load polls in a row a node misses before it is dropped and its games given to others
+LOAD_MISSES = 3
+
+
+# What a node last advertised of its game engine, how many games it was sent since and how
+# many load polls in a row it missed
+class NodeLoad:
+    __slots__ = ('node', 'workers', 'running', 'queued', 'cost', 'sent', 'misses')
+
+    def __init__(self, node, load: dict):
+        self.node = node
+        self.update(load)
+
+    def update(self, load: dict):
+        self.misses = 0
+        self.workers = load['workers']
+        self.running = load['running']
+        self.queued = load['queued']
+        self.cost = load['cost']
+        self.sent = 0
+
+    # Games the node takes before they would queue behind more than QUEUE_PER_WORKER each
+    @property
+    def free(self) -> int:
+        return self.workers * (1 + QUEUE_PER_WORKER) - self.running - self.queued - self.sent
+
+    # Workers with nothing to run
+    @property
+    def idle(self) -> int:
+        return self.workers - self.running - self.queued - self.sent
+
+    # A game of the node is over, it counts as one game lighter until its next load
+    def finished(self):
+        if self.sent > 0:
+            self.sent -= 1
+        elif self.queued > 0:
+            self.queued -= 1
+        elif self.running > 0:
+            self.running -= 1
+
+
+# A game of a round: the nodes running a copy of it, when the last copy was sent and
+# whether it waits to be sent (again). The lease of its nodes ends at deadline (wall clock
+# time, so it holds on whichever node coordinates the round), and checkpoint is the last
+# progress of the match they reported. Nodes whose lease ran out are avoided afterwards.
+class Placement:
+    __slots__ = ('game', 'nodes', 'sent', 'waiting', 'backup', 'deadline', 'checkpoint', 'avoid')
+
+    def __init__(self, game: dict):
+        self.game = game
+        self.nodes = set()
+        self.sent = None
+        self.waiting = True
+        self.backup = False
+        self.deadline = None
+        self.checkpoint = None
+        self.avoid = set()
+
+
+# Places the games of the rounds this node coordinates on the nodes with the most free
+# workers, from the loads they advertise. Each game runs on one node. It only gets a copy
+# elsewhere when its node stops answering, or as a speculative backup once it takes far
+# longer than games usually do. Games queued on a busy node can be taken back for an idle one.
+# Games are grouped by round, a group's games are forgotten as their results come in.
+# Every copy sent is leased until a deadline that progress reports push back. A game whose
+# lease runs out without a result is sent again, from the match's last checkpoint.
+class GameScheduler:
+    def __init__(self, speculate_factor: float = SPECULATE_FACTOR, speculate_min: float = SPECULATE_MIN,
+                 lease_time: float = LEASE_TIME, max_misses: int = LOAD_MISSES):
+        self.speculate_factor = speculate_factor
+        self.speculate_min = speculate_min
+        self.lease_time = lease_time
+        self.max_misses = max_misses
+        self.loads = {}  # node id -> NodeLoad
+        self.groups = {}  # group -> {game key: Placement}
+        self.waiting = {}  # group -> deque of the keys of games to send
+        self.events = {}  # group -> Event set when one of its games finishes
+        self.durations = deque(maxlen=DURATION_SAMPLES)
+        self.lock = threading.Lock()
+        self.speculated = 0
+        self.recovered = 0
+        self.stolen = 0
+        self.expired = 0
+
+    # Take in the loads of the nodes that answered, {node id: (node, load)}. A node that did
+    # not answer keeps its last load, it is dropped and its games wait for another node once
+    # it missed max_misses polls in a row. Its leases may run out before that.
+    def refresh(self, loads: dict):
+        with self.lock:
+            for node_id in list(self.loads):
+                if loads.get(node_id, (None, None))[1] is not None:
+                    continue
+                load = self.loads[node_id]
+                load.misses += 1
+                if load.misses >= self.max_misses:
+                    del self.loads[node_id]
+                    self._lost(node_id)
+            for node_id, (node, load) in loads.items():
+                if load is None:
+                    continue
+                if node_id in self.loads:
+                    self.loads[node_id].node = node
+                    self.loads[node_id].update(load)
+                else:
+                    self.loads[node_id] = NodeLoad(node, load)
+
+    def _lost(self, node_id: int):
+        for group, placements in self.groups.items():
+            for key, placement in placements.items():
+                if node_id in placement.nodes:
+                    placement.nodes.discard(node_id)
+                    if not placement.nodes and not placement.waiting:
+                        placement.waiting = True
+                        self.waiting.setdefault(group, deque()).appendleft(key)
+                        self.recovered += 1
+
+    # Games the nodes can take right now
+    def capacity(self) -> int:
+        with self.lock:
+            return sum(max(load.free, 0) for load in self.loads.values())
+
+    # Add a game to send, or one already out under a lease ({'node', 'deadline', 'checkpoint'})
+    # taken over from the round's previous coordinator
+    def add(self, group: str, key: str, game: dict, lease: dict = None):
+        with self.lock:
+            placements = self.groups.setdefault(group, {})
+            self.events.setdefault(group, threading.Event())
+            if key in placements:
+                return
+            placement = placements[key] = Placement(game)
+            if lease:
+                placement.checkpoint = lease.get('checkpoint')
+                if lease.get('node') is not None and lease['deadline'] > time.time():
+                    placement.nodes.add(lease['node'])
+                    placement.deadline = lease['deadline']
+                    placement.sent = time.monotonic()
+                    placement.waiting = False
+                    return
+            self.waiting.setdefault(group, deque()).append(key)
+
+    # Games of the group to send now, {node id: (node, [(key, game)])}, each game given to the
+    # node with the most free slots that does not run it yet, the least loaded one on a tie
+    def schedule(self, group: str) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            placements = self.groups.get(group, {})
+            queue = self.waiting.setdefault(group, deque())
+            self._expire(placements, queue)
+            self._speculate(placements, queue, now)
+            heap = [(-load.free, load.cost / max(load.workers, 1), node_id)
+                    for node_id, load in self.loads.items() if load.free > 0]
+            heapq.heapify(heap)
+            batches = {}
+            skipped = []
+            while queue and heap:
+                key = queue.popleft()
+                placement = placements.get(key)
+                if placement is None or not placement.waiting:
+                    continue
+                passed = []
+                while heap and (heap[0][2] in placement.nodes or heap[0][2] in placement.avoid):
+                    passed.append(heapq.heappop(heap))
+                if heap:
+                    free, cost, node_id = heapq.heappop(heap)
+                    load = self.loads[node_id]
+                    load.sent += 1
+                    placement.nodes.add(node_id)
+                    placement.waiting = False
+                    placement.sent = now
+                    placement.deadline = time.time() + self.lease_time
+                    game = placement.game
+                    if placement.checkpoint:
+                        game = dict(game, checkpoint=placement.checkpoint)
+                    batches.setdefault(node_id, (load.node, []))[1].append((key, game))
+                    if free + 1 < 0:
+                        heapq.heappush(heap, (free + 1, cost, node_id))
+                else:
+                    # Every node with room already runs it or let its lease run out, the
+                    # latter get another chance next time
+                    placement.avoid.clear()
+                    skipped.append(key)
+                for item in passed:
+                    heapq.heappush(heap, item)
+            queue.extendleft(reversed(skipped))
+            return batches
+
+    # Revoke the leases that ran out, the game goes to another node with room
+    def _expire(self, placements: dict, queue: deque):
+        now = time.time()
+        for key, placement in placements.items():
+            if not placement.waiting and placement.deadline is not None and placement.deadline < now:
+                placement.avoid.update(placement.nodes)
+                placement.nodes.clear()
+                placement.backup = False
+                placement.waiting = True
+                queue.appendleft(key)
+                self.expired += 1
+
+    # Queue a backup of the games out for much longer than the median game takes
+    def _speculate(self, placements: dict, queue: deque, now: float):
+        if not self.durations:
+            return
+        limit = max(self.speculate_min, self.speculate_factor * statistics.median(self.durations))
+        for key, placement in placements.items():
+            if placement.waiting or placement.backup or len(placement.nodes) != 1:
+                continue
+            if now - placement.sent > limit:
+                placement.backup = True
+                placement.waiting = True
+                queue.appendleft(key)
+                self.speculated += 1
+
+    # Games a node did not take go back to the front of their group's queue, and the node is
+    # considered full until its next load
+    def rejected(self, group: str, keys: list, node_id: int):
+        with self.lock:
+            self._requeue(group, keys, node_id)
+            load = self.loads.get(node_id)
+            if load is not None:
+                load.sent += max(load.free, 0)
+
+    # Games taken back from a node's queue, to be given to another
+    def released(self, group: str, keys: list, node_id: int):
+        with self.lock:
+            self._requeue(group, keys, node_id)
+            self.stolen += len(keys)
+            load = self.loads.get(node_id)
+            if load is not None:
+                load.queued = max(load.queued - len(keys), 0)
+
+    def _requeue(self, group: str, keys: list, node_id: int):
+        placements = self.groups.get(group, {})
+        queue = self.waiting.setdefault(group, deque())
+        for key in reversed(keys):
+            placement = placements.get(key)
+            if placement is None:
+                continue
+            placement.nodes.discard(node_id)
+            # A backup that did not get through is sent again too
+            if not placement.waiting and (not placement.nodes or placement.backup):
+                placement.waiting = True
+                queue.appendleft(key)
+
+    # A game's result came in, returns the nodes that were sent a copy of it
+    def finished(self, group: str, key: str) -> list:
+        with self.lock:
+            placement = self.groups.get(group, {}).pop(key, None)
+            if placement is None:
+                return []
+            if placement.sent is not None and not placement.backup:
+                self.durations.append(time.monotonic() - placement.sent)
+            for node_id in placement.nodes:
+                if node_id in self.loads:
+                    self.loads[node_id].finished()
+            event = self.events.get(group)
+            nodes = [self.loads[node_id].node for node_id in placement.nodes if node_id in self.loads]
+        if event is not None:
+            event.set()
+        return nodes
+
+    # Progress of a match from the node playing it, which renews its lease. False if the game
+    # is not out (anymore).
+    def checkpoint(self, group: str, key: str, checkpoint: dict) -> bool:
+        with self.lock:
+            placement = self.groups.get(group, {}).get(key)
+            if placement is None or placement.waiting:
+                return False
+            if not placement.checkpoint or checkpoint['played'] > placement.checkpoint['played']:
+                placement.checkpoint = checkpoint
+            placement.deadline = time.time() + self.lease_time
+            return True
+
+    # Lease table of the group's games still without a result, {key: {'node', 'deadline',
+    # 'checkpoint'}}, to hand the round over to another coordinator
+    def leases(self, group: str) -> dict:
+        with self.lock:
+            return {key: {'node': next(iter(placement.nodes), None), 'deadline': placement.deadline,
+                          'checkpoint': placement.checkpoint}
+                    for key, placement in self.groups.get(group, {}).items()
+                    if placement.nodes or placement.checkpoint}
+
+    # Busy nodes to take queued games of the group back from, [(node id, node, count)], as many
+    # as other nodes have idle workers, once the group has no game left to send
+    def steal_plan(self, group: str) -> list:
+        with self.lock:
+            if self.waiting.get(group):
+                return []
+            holding = {}  # node id -> games of the group it was sent
+            for placement in self.groups.get(group, {}).values():
+                for node_id in placement.nodes:
+                    holding[node_id] = holding.get(node_id, 0) + 1
+            queued = {node_id: min(self.loads[node_id].queued, count) for node_id, count in holding.items()
+                      if node_id in self.loads and self.loads[node_id].queued > 0}
+            taken = {}
+            for node_id, load in self.loads.items():
+                idle = load.idle
+                victims = [victim for victim in queued if victim != node_id and queued[victim] > 0]
+                if idle <= 0 or not victims:
+                    continue
+                victim = max(victims, key=queued.get)
+                count = min(idle, queued[victim])
+                queued[victim] -= count
+                taken[victim] = taken.get(victim, 0) + count
+            return [(node_id, self.loads[node_id].node, count) for node_id, count in taken.items()]
+
+    # Wait until a game of the group finishes or timeout seconds pass
+    def wait(self, group: str, timeout: float):
+        event = self.events.get(group)
+        if event is None:
+            return
+        event.wait(timeout)
+        event.clear()
+
+    # Whether games of the group wait to be sent
+    def pending(self, group: str) -> bool:
+        with self.lock:
+            return bool(self.waiting.get(group))
+
+    def done(self, group: str) -> bool:
+        with self.lock:
+            return not self.groups.get(group)
+
+    def drop(self, group: str):
+        with self.lock:
+            self.groups.pop(group, None)
+            self.waiting.pop(group, None)
+            self.events.pop(group, None)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from .codec import get_codec
+from .codes import STATUS_OK, STATUS_ERROR, STATUS_TOO_LARGE, STATUS_BUSY
+from .transport import HEADER, COALESCE_LIMIT, MAX_MESSAGE_SIZE
+
+# Read buffer of each connection stream, payloads are accumulated past it without
+# being re-copied on every read
+STREAM_BUFFER_SIZE = 256 * 1024
+
+
+# Raised by a handler that is overloaded, answered with STATUS_BUSY so the caller can go elsewhere
+class Busy(Exception):
+    pass
+
+
+# Event loop serving framed requests on persistent connections. Ops in `fast_ops` are
+# answered directly on the loop, everything else runs on a bounded pool of worker threads.
+# Once `max_pending` requests are queued or running, connections stop being read until a
+# worker frees up. Requests larger than `max_message_size` are refused and their
+# connection dropped. Payloads are decoded with the codec named in the frame flags before
+# reaching the handler, and its result is encoded back with the same codec.
+class RequestServer:
+    def __init__(self, ip: str, port: int, handler, fast_ops=(), workers: int = 8, backlog: int = 128,
+                 max_pending: int = 64, idle_timeout: float = 60, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.ip = ip
+        self.port = port
+        self.handler = handler
+        self.fast_ops = frozenset(fast_ops)
+        self.workers = workers
+        self.backlog = backlog
+        self.max_pending = max_pending
+        self.idle_timeout = idle_timeout
+        self.max_message_size = max_message_size
+        self.executor = None
+        self.pending = None
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rpc-worker')
+        self.pending = asyncio.Semaphore(self.max_pending)
+        server = await asyncio.start_server(self._serve_connection, self.ip, self.port, backlog=self.backlog,
+                                            reuse_address=True, limit=STREAM_BUFFER_SIZE)
+        logging.info(f"Server: {self.ip}:{self.port} (workers={self.workers}, backlog={self.backlog})")
+        async with server:
+            await server.serve_forever()
+
+    def _call(self, op: int, payload: bytes, flags: int):
+        try:
+            codec = get_codec(flags)
+            resp = self.handler(op, codec.decode(payload))
+            return STATUS_OK, b'' if resp is None else codec.encode(resp)
+        except Busy as e:
+            logging.info(f"Rejected op {op}: {e}")
+            return STATUS_BUSY, b''
+        except Exception as e:
+            logging.error(f"Error handling op {op}: {e}")
+            return STATUS_ERROR, b''
+
+    async def _respond(self, writer: asyncio.StreamWriter, request_id: int, status: int, resp: bytes,
+                       flags: int = 0):
+        if writer.is_closing():
+            return
+        header = HEADER.pack(len(resp), request_id, status, flags)
+        if len(resp) <= COALESCE_LIMIT:
+            writer.write(header + resp)
+        else:
+            writer.write(header)
+            writer.write(resp)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _run_in_worker(self, writer, request_id: int, op: int, payload: bytes, flags: int):
+        try:
+            loop = asyncio.get_running_loop()
+            status, resp = await loop.run_in_executor(self.executor, self._call, op, payload, flags)
+        finally:
+            self.pending.release()
+        await self._respond(writer, request_id, status, resp, flags)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        in_flight = set()
+        try:
+            while True:
+                # Only drop the connection for idleness when nothing is being served on it
+                timeout = None if in_flight else self.idle_timeout
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(HEADER.size), timeout)
+                    length, request_id, op, flags = HEADER.unpack(header)
+                    if length > self.max_message_size:
+                        logging.error(f'request of {length} bytes from {addr} exceeds the '
+                                      f'{self.max_message_size} bytes limit')
+                        await self._respond(writer, request_id, STATUS_TOO_LARGE, b'')
+                        break
+                    payload = await reader.readexactly(length) if length else b''
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+
+                if op in self.fast_ops:
+                    await self._respond(writer, request_id, *self._call(op, payload, flags), flags)
+                    continue
+
+                await self.pending.acquire()
+                task = asyncio.create_task(self._run_in_worker(writer, request_id, op, payload, flags))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        finally:
+            writer.close()
+            logging.info(f'connection from {addr} closed')
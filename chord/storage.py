@@ -0,0 +1,243 @@
+import bisect
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from .utils import hash_function
+
+# Number of ring segments with their own digest, used to find which part of a replica diverged
+DIGEST_BUCKETS = 16
+# Deleted keys remembered in the change log before the oldest are forgotten
+MAX_TOMBSTONES = 1024
+
+
+def _fingerprint(key: str, version: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f'{key}:{version}'.encode(), digest_size=8).digest(), 'big')
+
+
+# Key-value store that keeps its keys sorted by ring hash, so the keys falling in an
+# interval (start, end] of the ring are found with a binary search instead of a full scan.
+# Every write gets a version from a sequence number, so replicas can ask for the changes
+# made after the last version they saw.
+class KeyStore:
+    def __init__(self, m: int, data: dict = None):
+        self.m = m
+        self.values = {}
+        self.hashes = {}  # key -> ring hash, computed once on insert
+        self.hash_index = []  # sorted ring hashes
+        self.key_index = []  # keys, aligned with hash_index
+        self.lock = threading.RLock()
+        self.epoch = os.urandom(4).hex()  # Identifies this incarnation of the sequence
+        self.seq = 0
+        self.versions = {}  # key -> version of its current value
+        self.changes = OrderedDict()  # key -> version of its last change, oldest first, deletions included
+        self.floor = 0  # Changes up to this version are no longer all in the change log
+        self.digests = [0] * DIGEST_BUCKETS  # xor of the key fingerprints of each ring segment
+        # When used as a replica: the node it mirrors and how far it is synced
+        self.owner = None
+        self.synced_epoch = None
+        self.synced_seq = 0
+        # Receives every update as journal.append(op, key, value), set after the initial load
+        self.journal = None
+        if data:
+            self.update(data)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.values))
+
+    def __repr__(self):
+        return f'KeyStore({len(self.values)} keys)'
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            h = self.hashes.pop(key)
+            del self.values[key]
+            lo = bisect.bisect_left(self.hash_index, h)
+            pos = self.key_index.index(key, lo)
+            del self.hash_index[pos]
+            del self.key_index[pos]
+            self._forget(key, h)
+
+    def _bucket(self, h: int) -> int:
+        return h * DIGEST_BUCKETS >> self.m
+
+    # Version bookkeeping for a key that has just been removed
+    def _forget(self, key, h: int):
+        if self.journal is not None:
+            self.journal.append('del', key)
+        self.digests[self._bucket(h)] ^= _fingerprint(key, self.versions.pop(key))
+        self.seq += 1
+        self.changes[key] = self.seq
+        self.changes.move_to_end(key)
+        if len(self.changes) - len(self.values) > 2 * MAX_TOMBSTONES:
+            self._trim_tombstones()
+
+    def _trim_tombstones(self):
+        excess = len(self.changes) - len(self.values) - MAX_TOMBSTONES
+        for key, version in list(self.changes.items()):
+            if excess <= 0:
+                break
+            if key not in self.values:
+                del self.changes[key]
+                self.floor = max(self.floor, version)
+                excess -= 1
+
+    # Store a value, with the given version when mirroring another store
+    def put(self, key, value, version: int = None):
+        with self.lock:
+            if version is None:
+                self.seq += 1
+                version = self.seq
+            else:
+                self.seq = max(self.seq, version)
+            if key not in self.values:
+                h = hash_function(key, self.m)
+                pos = bisect.bisect_right(self.hash_index, h)
+                self.hash_index.insert(pos, h)
+                self.key_index.insert(pos, key)
+                self.hashes[key] = h
+            else:
+                h = self.hashes[key]
+                self.digests[self._bucket(h)] ^= _fingerprint(key, self.versions[key])
+            if self.journal is not None:
+                self.journal.append('set', key, value)
+            self.values[key] = value
+            self.versions[key] = version
+            self.digests[self._bucket(h)] ^= _fingerprint(key, version)
+            self.changes[key] = version
+            self.changes.move_to_end(key)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    # Value of a key with a token of its version, '<epoch>-<version>', (None, None) if missing
+    def get_versioned(self, key):
+        with self.lock:
+            if key not in self.values:
+                return None, None
+            return f'{self.epoch}-{self.versions[key]}', self.values[key]
+
+    def pop(self, key, *default):
+        with self.lock:
+            if key not in self.values:
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            value = self.values[key]
+            del self[key]
+            return value
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+    def update(self, data: dict):
+        with self.lock:
+            for key, value in data.items():
+                self[key] = value
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+    # Index slices [lo, hi) covering the hashes in (start, end], two slices when it wraps around 0
+    def _slices(self, start: int, end: int):
+        lo = bisect.bisect_right(self.hash_index, start)
+        hi = bisect.bisect_right(self.hash_index, end)
+        if start < end:
+            return [(lo, hi)]
+        return [(lo, len(self.hash_index)), (0, hi)]
+
+    # Keys whose hash falls in (start, end], in clockwise order from start
+    def range_keys(self, start: int, end: int) -> list:
+        with self.lock:
+            keys = []
+            for lo, hi in self._slices(start, end):
+                keys.extend(self.key_index[lo:hi])
+            return keys
+
+    # First key clockwise after start whose hash falls in (start, end], or None
+    def first_key(self, start: int, end: int):
+        with self.lock:
+            for lo, hi in self._slices(start, end):
+                if lo < hi:
+                    return self.key_index[lo]
+            return None
+
+    def range_items(self, start: int, end: int) -> dict:
+        with self.lock:
+            return {key: self.values[key] for key in self.range_keys(start, end)}
+
+    # Changes made after version `since` as {'epoch', 'seq', 'full', 'items': {key: [version, value]},
+    # 'deleted': [[key, version]]}, a full snapshot when they are not all in the change log anymore
+    def changes_since(self, epoch: str = None, since: int = 0) -> dict:
+        with self.lock:
+            if epoch != self.epoch or since < self.floor:
+                return self.snapshot()
+            items, deleted = {}, []
+            for key in reversed(self.changes):
+                if self.changes[key] <= since:
+                    break
+                if key in self.values:
+                    items[key] = [self.versions[key], self.values[key]]
+                else:
+                    deleted.append([key, self.changes[key]])
+            return {'epoch': self.epoch, 'seq': self.seq, 'full': False, 'items': items, 'deleted': deleted}
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            items = {key: [self.versions[key], value] for key, value in self.values.items()}
+            return {'epoch': self.epoch, 'seq': self.seq, 'full': True, 'items': items, 'deleted': []}
+
+    # Apply a delta produced by changes_since on the store being mirrored
+    def apply_delta(self, delta: dict):
+        with self.lock:
+            if delta['full']:
+                for key in list(self.values):
+                    if key not in delta['items']:
+                        del self[key]
+            for key, (version, value) in delta['items'].items():
+                # A pull may already have brought a newer version than a late push
+                if self.versions.get(key, 0) < version or delta['full']:
+                    self.put(key, value, version)
+            for key, version in delta['deleted']:
+                if key in self.values and self.versions[key] < version:
+                    del self[key]
+            self.synced_epoch = delta['epoch']
+            self.synced_seq = max(self.synced_seq, delta['seq']) if not delta['full'] else delta['seq']
+
+    # Ring interval (start, end] covered by a digest bucket
+    def bucket_range(self, bucket: int):
+        size = 2 ** self.m // DIGEST_BUCKETS
+        return bucket * size - 1, (bucket + 1) * size - 1
+
+    def range_snapshot(self, start: int, end: int) -> dict:
+        with self.lock:
+            return {key: [self.versions[key], self.values[key]] for key in self.range_keys(start, end)}
+
+    # Replace every key in (start, end] with the given {key: [version, value]} items
+    def replace_range(self, start: int, end: int, items: dict):
+        with self.lock:
+            for key in self.range_keys(start, end):
+                if key not in items:
+                    del self[key]
+            for key, (version, value) in items.items():
+                if self.versions.get(key) != version:
+                    self.put(key, value, version)
@@ -0,0 +1,126 @@
+import itertools
+import logging
+import socket
+import struct
+import threading
+import time
+
+# Frame header: payload length, request id, op (status on responses), flags (payload codec)
+HEADER = struct.Struct('!IIHB')
+
+# Seconds an idle pooled connection is kept before being discarded
+POOL_IDLE_TIMEOUT = 30
+# Default upper bound for a single frame payload
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+# Payloads above this size are sent after the header instead of being copied into one buffer
+COALESCE_LIMIT = 64 * 1024
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class MessageTooLarge(Exception):
+    pass
+
+
+# Read exactly `size` bytes into a buffer allocated once up front
+def recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if not n:
+            raise ConnectionClosed(f'connection closed after {received} of {size} bytes')
+        received += n
+    return buf
+
+
+def send_frame(sock: socket.socket, request_id: int, op: int, payload: bytes = b'', flags: int = 0):
+    header = HEADER.pack(len(payload), request_id, op, flags)
+    if len(payload) <= COALESCE_LIMIT:
+        sock.sendall(header + payload)
+    else:
+        sock.sendall(header)
+        sock.sendall(payload)
+
+
+# Read one frame, returns None if the peer closed the connection between frames
+def recv_frame(sock: socket.socket, max_size: int = MAX_MESSAGE_SIZE):
+    first = sock.recv(HEADER.size)
+    if not first:
+        return None
+    header = first if len(first) == HEADER.size else first + recv_exact(sock, HEADER.size - len(first))
+    length, request_id, op, flags = HEADER.unpack(header)
+    if length > max_size:
+        raise MessageTooLarge(f'frame of {length} bytes exceeds the {max_size} bytes limit')
+    payload = recv_exact(sock, length) if length else b''
+    return request_id, op, flags, payload
+
+
+class ConnectionPool:
+    def __init__(self, timeout: float = 20, max_idle: int = 4, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_message_size = max_message_size
+        self.idle = {}  # (ip, port) -> [(socket, last_used)]
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+
+    def _acquire(self, address):
+        now = time.monotonic()
+        with self.lock:
+            conns = self.idle.get(address, [])
+            while conns:
+                sock, last_used = conns.pop()
+                if now - last_used < POOL_IDLE_TIMEOUT:
+                    return sock, True
+                sock.close()
+        sock = socket.create_connection(address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, False
+
+    def _release(self, address, sock):
+        with self.lock:
+            conns = self.idle.setdefault(address, [])
+            if len(conns) < self.max_idle:
+                conns.append((sock, time.monotonic()))
+                return
+        sock.close()
+
+    def discard(self, address):
+        with self.lock:
+            conns = self.idle.pop(address, [])
+        for sock, _ in conns:
+            sock.close()
+
+    # Send a request and wait for its response, returns (status, flags, payload)
+    def request(self, address, op: int, payload: bytes = b'', flags: int = 0):
+        if len(payload) > self.max_message_size:
+            raise MessageTooLarge(f'request of {len(payload)} bytes exceeds the {self.max_message_size} bytes limit')
+        request_id = next(self.request_ids) & 0xFFFFFFFF
+        while True:
+            sock, reused = self._acquire(address)
+            try:
+                send_frame(sock, request_id, op, payload, flags)
+                frame = recv_frame(sock, self.max_message_size)
+                if frame is None:
+                    raise ConnectionClosed(f'{address} closed the connection')
+            except (ConnectionClosed, ConnectionResetError, BrokenPipeError) as e:
+                sock.close()
+                if reused:
+                    # The peer dropped an idle pooled connection, retry on a fresh one
+                    logging.debug(f'stale connection to {address}: {e}')
+                    continue
+                raise
+            except Exception:
+                sock.close()
+                raise
+
+            resp_id, status, resp_flags, resp = frame
+            if resp_id != request_id:
+                sock.close()
+                raise ConnectionError(f'unexpected response id {resp_id} from {address}, expected {request_id}')
+            self._release(address, sock)
+            return status, resp_flags, resp
@@ -1 +1,5 @@
+from . import games
 from . import tournament
+from . import state
+from . import player_cache
+from . import engine
@@ -0,0 +1,276 @@
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .player_cache import PlayerCache
+from .games import play_match
+
+# Seconds a match may take before its worker is killed, and seconds of CPU time it may use,
+# which player code spinning up threads can burn faster than the clock
+GAME_TIMEOUT = 10.0
+GAME_CPU_LIMIT = 10
+# Address space of each worker process, in bytes
+WORKER_MEMORY_LIMIT = 512 * 1024 * 1024
+# Games waiting for a worker before new ones are rejected
+QUEUE_SIZE = 64
+# Seconds between two progress reports of a match
+PROGRESS_INTERVAL = 0.5
+# Threads calling back with the results of matches, which may wait on the network while
+# the workers go on with the next game
+REPORT_THREADS = 16
+
+
+def _worker_main(conn, current, memory_limit: int, cpu_limit: int):
+    if resource is not None and memory_limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ValueError, OSError) as e:
+            logging.error(f'cannot limit worker memory: {e}')
+    cache = PlayerCache()
+    last = [0.0]
+
+    # Checkpoints of the match go back to the engine at most every PROGRESS_INTERVAL
+    def progress(checkpoint):
+        now = time.monotonic()
+        if now - last[0] >= PROGRESS_INTERVAL:
+            last[0] = now
+            conn.send(('progress', checkpoint))
+
+    while True:
+        try:
+            codes, options = conn.recv()
+        except (EOFError, OSError):
+            return
+        if resource is not None and cpu_limit:
+            _limit_cpu(cpu_limit)
+        try:
+            plays = []
+            for i, code in enumerate(codes):
+                current.value = i
+                plays.append(cache.get_play(code))
+            last[0] = time.monotonic()
+            result = play_match(plays, current=current, progress=progress, **options)
+        except BaseException as e:
+            result = {'failed': current.value, 'error': repr(e)}
+        conn.send(result)
+
+
+# Let the worker use cpu_limit more seconds of CPU time, past them the kernel kills it
+# (SIGXCPU) and the engine blames the player it was running. The hard limit is left alone,
+# a process cannot raise it back.
+def _limit_cpu(cpu_limit: int):
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_limit
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    except (ValueError, OSError) as e:
+        logging.error(f'cannot limit worker CPU time: {e}')
+
+
+# A match waiting for or running on a worker: the code of each player and play_match options
+class Job:
+    __slots__ = ('key', 'codes', 'options', 'callback', 'cost', 'group', 'progress', 'started', 'cancelled')
+
+    def __init__(self, key: str, codes: list, options: dict, callback, cost: float, group: str = None,
+                 progress=None):
+        self.key = key
+        self.codes = codes
+        self.options = options
+        self.callback = callback
+        self.cost = cost
+        self.group = group  # Games submitted together, e.g. a round, that can be taken back together
+        self.progress = progress  # progress(key, checkpoint) while the match is played
+        self.started = False
+        self.cancelled = False
+
+
+# Runs player code in a bounded pool of worker processes, away from the node's threads and
+# the GIL. Each match has a wall-clock and a CPU time limit and each worker a memory limit; a
+# worker that runs over, crashes or is cancelled is killed and replaced. Once queue_size games
+# are waiting, submit rejects new ones instead of letting them pile up. Cancelled and stolen
+# games do not count, they are skipped when a worker takes them off the queue.
+class GameEngine:
+    def __init__(self, workers: int = None, queue_size: int = QUEUE_SIZE, game_timeout: float = GAME_TIMEOUT,
+                 memory_limit: int = WORKER_MEMORY_LIMIT, report_threads: int = REPORT_THREADS,
+                 cpu_limit: int = GAME_CPU_LIMIT):
+        self.workers = workers or os.cpu_count() or 1
+        self.report_threads = report_threads
+        self.results = queue.Queue()  # (job, result) of the matches played, for their callbacks
+        self.game_timeout = game_timeout
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.queue_size = queue_size
+        self.jobs = queue.Queue()
+        self.active = {}  # key -> Job, queued or running
+        self.queued = 0  # Games of jobs waiting for a worker and not cancelled
+        self.running = 0
+        self.cost = 0.0  # Declared cost of the queued and running matches
+        self.lock = threading.Lock()
+        self.started = False
+        self.context = multiprocessing.get_context('spawn')  # Forking a threaded node is unsafe
+
+    # Queue a match, callback(key, result) gets the play_match result, with 'failed' set to the
+    # index of the player that crashed or ran out of time. A match resumes from checkpoint if
+    # given, and progress(key, checkpoint) hears of it as it goes. Returns False when the
+    # engine is full.
+    def submit(self, key: str, codes: list, callback, game: str = None, games: int = 1,
+               decisive: bool = False, cost: float = 1.0, group: str = None, checkpoint: dict = None,
+               progress=None) -> bool:
+        self._start()
+        options = {'game': game, 'games': games, 'decisive': decisive, 'checkpoint': checkpoint}
+        job = Job(key, codes, options, callback, cost, group, progress)
+        with self.lock:
+            if key in self.active:
+                return True
+            if self.queued >= self.queue_size:
+                logging.info(f'game engine full, rejecting {key}')
+                return False
+            self.jobs.put_nowait(job)
+            self.active[key] = job
+            self.queued += 1
+            self.cost += cost
+        return True
+
+    # Drop a queued game, or kill the worker running it. Its callback is not called.
+    def cancel(self, key: str) -> bool:
+        with self.lock:
+            job = self.active.pop(key, None)
+            if job is None:
+                return False
+            self.cost -= job.cost
+            if not job.started:
+                self.queued -= 1
+            job.cancelled = True
+        return True
+
+    # Drop up to count games of a group that no worker has started, returns their keys
+    def steal(self, group: str, count: int) -> list:
+        keys = []
+        with self.lock:
+            for job in list(self.active.values()):
+                if len(keys) >= count:
+                    break
+                if job.group == group and not job.started:
+                    del self.active[job.key]
+                    self.cost -= job.cost
+                    self.queued -= 1
+                    job.cancelled = True
+                    keys.append(job.key)
+        return keys
+
+    def load(self) -> dict:
+        with self.lock:
+            return {'workers': self.workers, 'running': self.running, 'cost': self.cost, 'queued': self.queued}
+
+    def _start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._dispatch, name=f'game-worker-{i}', daemon=True).start()
+        for i in range(self.report_threads):
+            threading.Thread(target=self._report, name=f'game-report-{i}', daemon=True).start()
+
+    # A worker process, its end of the pipe and the index of the player it is running
+    def _spawn(self):
+        parent, child = self.context.Pipe()
+        current = self.context.Value('b', -1, lock=False)
+        process = self.context.Process(target=_worker_main, args=(child, current, self.memory_limit, self.cpu_limit),
+                                       daemon=True)
+        process.start()
+        child.close()
+        return process, parent, current
+
+    @staticmethod
+    def _kill(process, conn):
+        process.kill()
+        process.join()
+        conn.close()
+
+    # Feed queued games to one worker process, replacing it whenever it has to be killed.
+    # Results are handed to the report threads, the worker gets its next game right away.
+    def _dispatch(self):
+        process, conn, current = self._spawn()
+        while True:
+            job = self.jobs.get()
+            with self.lock:
+                # Checked under the lock, so a game is either stolen or started, never both
+                if job.cancelled:
+                    continue
+                job.started = True
+                self.queued -= 1
+                self.running += 1
+            try:
+                result = self._play(conn, current, job)
+                if result.get('error') in ('timeout', 'crashed', 'cancelled'):
+                    self._kill(process, conn)
+                    process, conn, current = self._spawn()
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    if self.active.get(job.key) is job:
+                        del self.active[job.key]
+                        self.cost -= job.cost
+            if not job.cancelled:
+                self.results.put((job, result))
+
+    # Call back with the results of the matches played
+    def _report(self):
+        while True:
+            job, result = self.results.get()
+            if job.cancelled:
+                continue
+            try:
+                job.callback(job.key, result)
+            except Exception as e:
+                logging.error(f'Error finishing game {job.key}: {e}')
+
+    # Run one match on a worker, blaming the player it was running if it has to be killed
+    def _play(self, conn, current, job: Job) -> dict:
+        error = None
+        try:
+            conn.send((job.codes, job.options))
+            deadline = time.monotonic() + self.game_timeout
+            while True:
+                if conn.poll(0.1):
+                    message = conn.recv()
+                    if isinstance(message, tuple):
+                        # ('progress', checkpoint) while the match goes on
+                        self._progress(job, message[1])
+                        continue
+                    if message.get('error'):
+                        logging.error(f'player of {job.key} failed: {message['error']}')
+                    return message
+                if job.cancelled:
+                    error = 'cancelled'
+                    break
+                if time.monotonic() > deadline:
+                    logging.error(f'match {job.key} timed out after {self.game_timeout}s')
+                    error = 'timeout'
+                    break
+        except (EOFError, OSError) as e:
+            logging.error(f'worker running {job.key} died: {e}')
+            error = 'crashed'
+        return {'failed': max(current.value, 0), 'error': error}
+
+    @staticmethod
+    def _progress(job: Job, checkpoint: dict):
+        if job.progress is None or job.cancelled:
+            return
+        try:
+            job.progress(job.key, checkpoint)
+        except Exception as e:
+            logging.error(f'Error reporting progress of {job.key}: {e}')
@@ -0,0 +1,24 @@
+# Registry of the games tournaments can be played on, by name
+GAMES = {}
+DEFAULT_GAME = 'rps'
+
+
+def register(rules):
+    GAMES[rules.name] = rules()
+    return rules
+
+
+def get_game(name: str = None):
+    try:
+        return GAMES[name or DEFAULT_GAME]
+    except KeyError:
+        raise ValueError(f'unknown game {name}')
+
+
+def play_match(plays: list, game: str = None, games: int = 1, decisive: bool = False, current=None,
+               checkpoint: dict = None, progress=None) -> dict:
+    return get_game(game).play_match(plays, games, decisive, current, checkpoint, progress)
+
+
+from . import rps
+from . import tictactoe
@@ -0,0 +1,97 @@
+import random
+
+DRAW, PLAYER1, PLAYER2 = 0, 1, 2
+# Extra games played one by one when a match that needs a winner ends tied
+SUDDEN_DEATH_GAMES = 100
+
+
+class IllegalMove(Exception):
+    pass
+
+
+# Games played, wins of each player and draws of a match, from its last checkpoint if any
+def resume(checkpoint: dict = None):
+    if not checkpoint:
+        return 0, [0, 0], 0
+    return checkpoint['played'], list(checkpoint['wins']), checkpoint['draws']
+
+
+# Rules of a two player game. A game is a turn loop over a compact state: the player to
+# move is shown its view of the state, answers with a move, and the move is applied until
+# the game has an outcome. A player that answers with an illegal move loses.
+class GameRules:
+    name = None
+    # CPU cost of one game relative to rock-paper-scissors, for placing heavy matches
+    cost = 1.0
+    # Swap who moves first every game of a match
+    alternate = False
+
+    def initial_state(self):
+        raise NotImplementedError
+
+    # Index of the player to move
+    def to_move(self, state) -> int:
+        raise NotImplementedError
+
+    # Ask a player for its move in the given state
+    def ask(self, play, state, player: int):
+        return play()
+
+    # State after the move, raises IllegalMove
+    def apply(self, state, player: int, move):
+        raise NotImplementedError
+
+    # DRAW, PLAYER1 or PLAYER2 once the game is over, None before
+    def outcome(self, state):
+        raise NotImplementedError
+
+    # Play one game with plays[seats[i]] as the i-th player to move
+    def play_game(self, plays: list, current=None, seats=(0, 1)) -> int:
+        state = self.initial_state()
+        while True:
+            result = self.outcome(state)
+            if result is not None:
+                return result
+            player = self.to_move(state)
+            if current is not None:
+                current.value = seats[player]
+            play = plays[seats[player]]
+            try:
+                if play is None:
+                    raise IllegalMove('no play function')
+                state = self.apply(state, player, self.ask(play, state, player))
+            except IllegalMove:
+                return PLAYER2 if player == 0 else PLAYER1
+
+    # Play a match of `games` games. current.value is set to the index of the player
+    # running so a supervisor can blame it if it never returns. A tied match goes to
+    # sudden death when `decisive`, and is decided by lot if still tied. The match resumes
+    # from a checkpoint ({'played', 'wins', 'draws'}) if given, and progress gets one after
+    # every game.
+    def play_match(self, plays: list, games: int = 1, decisive: bool = False, current=None,
+                   checkpoint: dict = None, progress=None) -> dict:
+        played, wins, draws = resume(checkpoint)
+        for game in range(played, games):
+            seats = (1, 0) if self.alternate and game % 2 else (0, 1)
+            result = self.play_game(plays, current, seats)
+            if result == DRAW:
+                draws += 1
+            else:
+                wins[seats[result - 1]] += 1
+            if progress is not None:
+                progress({'played': game + 1, 'wins': list(wins), 'draws': draws})
+        if decisive and wins[0] == wins[1]:
+            draws += self.break_tie(plays, wins, current)
+        return {'wins': wins, 'draws': draws, 'failed': None}
+
+    # Sudden death: games until one is won, adds the win and returns the games drawn meanwhile
+    def break_tie(self, plays: list, wins: list, current=None) -> int:
+        extra = 0
+        for _ in range(SUDDEN_DEATH_GAMES):
+            result = self.play_game(plays, current)
+            if result != DRAW:
+                wins[result - 1] += 1
+                return extra
+            extra += 1
+        wins[random.randrange(2)] += 1
+        return extra
@@ -0,0 +1,79 @@
+import operator
+from itertools import repeat
+
+from .base import GameRules, DRAW, PLAYER1, PLAYER2, resume
+from . import register
+
+MOVES = {'rock': 0, 'paper': 1, 'scissor': 2}
+INVALID = 3  # Any other answer, loses against a valid move
+# Outcome of every pair of moves, indexed by move1 << 2 | move2
+OUTCOMES = bytearray(256)
+for _m1 in range(4):
+    for _m2 in range(4):
+        if _m1 == _m2:
+            OUTCOMES[_m1 << 2 | _m2] = DRAW
+        elif _m2 == INVALID or (_m1 != INVALID and (_m1 - _m2) % 3 == 1):
+            OUTCOMES[_m1 << 2 | _m2] = PLAYER1
+        else:
+            OUTCOMES[_m1 << 2 | _m2] = PLAYER2
+OUTCOMES = bytes(OUTCOMES)
+
+
+def _encode_moves(moves: list) -> bytes:
+    try:
+        return bytes(map(MOVES.get, moves, repeat(INVALID)))
+    except TypeError:
+        # An unhashable answer
+        return bytes(MOVES.get(m, INVALID) if isinstance(m, str) else INVALID for m in moves)
+
+
+# Outcome of each game of two equally long move sequences, as a bytes of DRAW/PLAYER1/PLAYER2
+def resolve(moves1: list, moves2: list) -> bytes:
+    pairs = bytes(map(operator.or_, map(operator.lshift, _encode_moves(moves1), repeat(2)), _encode_moves(moves2)))
+    return pairs.translate(OUTCOMES)
+
+
+def _moves(play, games: int) -> list:
+    if play is None:
+        return [None] * games
+    return [play() for _ in range(games)]
+
+
+# Both players answer play() with 'rock', 'paper' or 'scissor' at the same time. Games are
+# independent, so a match calls each player in one batch and resolves every game at once.
+@register
+class RockPaperScissors(GameRules):
+    name = 'rps'
+    cost = 1.0
+
+    # State: the moves made so far, one per player
+    def initial_state(self):
+        return ()
+
+    def to_move(self, state) -> int:
+        return len(state)
+
+    def apply(self, state, player: int, move):
+        return state + (move,)
+
+    def outcome(self, state):
+        if len(state) < 2:
+            return None
+        return resolve([state[0]], [state[1]])[0]
+
+    # The games left after a checkpoint are played in one batch, so progress is not reported
+    def play_match(self, plays: list, games: int = 1, decisive: bool = False, current=None,
+                   checkpoint: dict = None, progress=None) -> dict:
+        played, wins, draws = resume(checkpoint)
+        moves = []
+        for i, play in enumerate(plays):
+            if current is not None:
+                current.value = i
+            moves.append(_moves(play, games - played))
+        outcomes = resolve(*moves)
+        wins[0] += outcomes.count(PLAYER1)
+        wins[1] += outcomes.count(PLAYER2)
+        draws += len(outcomes) - outcomes.count(PLAYER1) - outcomes.count(PLAYER2)
+        if decisive and wins[0] == wins[1]:
+            draws += self.break_tie(plays, wins, current)
+        return {'wins': wins, 'draws': draws, 'failed': None}
@@ -0,0 +1,51 @@
+from .base import GameRules, IllegalMove, DRAW, PLAYER1, PLAYER2
+from . import register
+
+FULL = 0x1ff
+# Bit masks of the rows, columns and diagonals of the 3x3 board, cell i is bit i
+LINES = (0x007, 0x038, 0x1c0, 0x049, 0x092, 0x124, 0x111, 0x054)
+# Whether a set of cells holds a line, for every 9 bit board
+WINNING = bytes(any(board & line == line for line in LINES) for board in range(FULL + 1))
+MARKS = 'XO'
+
+
+# Players alternate placing their mark, X first, and swap marks every game of a match.
+# play(board, mark) gets the board as a 9 character string of 'X', 'O' and '.', row by row,
+# and answers with the index of a free cell.
+@register
+class TicTacToe(GameRules):
+    name = 'tictactoe'
+    cost = 30.0
+    alternate = True
+
+    # State: a bitboard of the cells of each player
+    def initial_state(self):
+        return 0, 0
+
+    def to_move(self, state) -> int:
+        x, o = state
+        return bin(x).count('1') - bin(o).count('1')
+
+    def ask(self, play, state, player: int):
+        x, o = state
+        board = ''.join('X' if x >> i & 1 else 'O' if o >> i & 1 else '.' for i in range(9))
+        return play(board, MARKS[player])
+
+    def apply(self, state, player: int, move):
+        if not isinstance(move, int) or not 0 <= move < 9:
+            raise IllegalMove(f'{move!r} is not a cell')
+        cell = 1 << move
+        x, o = state
+        if (x | o) & cell:
+            raise IllegalMove(f'cell {move} is taken')
+        return (x | cell, o) if player == 0 else (x, o | cell)
+
+    def outcome(self, state):
+        x, o = state
+        if WINNING[x]:
+            return PLAYER1
+        if WINNING[o]:
+            return PLAYER2
+        if x | o == FULL:
+            return DRAW
+        return None
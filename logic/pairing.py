@@ -0,0 +1,117 @@
+import math
+
+
+# A game between two players, with the hashes their code is stored under
+def game(p1: dict, p2: dict) -> dict:
+    return {"player1": {p1["name"]: p1["score"]}, "player2": {p2["name"]: p2["score"]},
+            "codes": [p1.get("code_hash"), p2.get("code_hash")]}
+
+
+# Round robin: every player meets every other once, in len(players) - 1 rounds (one more
+# with an odd count, each player sitting one round out)
+def round_robin_rounds(count: int) -> int:
+    if count < 2:
+        return 0
+    return count - 1 if count % 2 == 0 else count
+
+
+def round_robin_size(count: int) -> int:
+    return count // 2
+
+
+# Games of round `index` by the circle method: the first seat stays, the others rotate one
+# seat per round and seat i plays seat n - 1 - i. Pairings are computed as they are taken,
+# nothing proportional to the whole schedule is built.
+def round_robin(players: list, index: int):
+    n = len(players) + len(players) % 2  # An odd count gets an empty seat, the bye
+    if n < 2:
+        return
+    rotating = n - 1
+
+    def seat(i):
+        if i == 0:
+            return 0
+        return 1 + (i - 1 + index) % rotating
+
+    for i in range(n // 2):
+        a, b = seat(i), seat(n - 1 - i)
+        if a < len(players) and b < len(players):
+            yield game(players[a], players[b])
+
+
+def swiss_rounds(count: int) -> int:
+    return math.ceil(math.log2(count)) if count > 1 else 0
+
+
+# Swiss round: players sorted by score are paired with the next player of their score group,
+# or the groups below, they have not met yet. A player left with nobody it has not met takes
+# the place of a player of an earlier pair, whose partner then plays the next one left, and
+# only when no pair can be split that way does it get a rematch. `played` holds
+# frozenset({name, name}) of every pairing so far. With an odd count, `bye` is left out.
+def swiss(players: list, played: set, bye: dict = None):
+    pending = [p for p in sorted(players, key=lambda p: -p["score"]) if p is not bye]
+    pending.reverse()  # Highest score last, taken with pop()
+    met = lambda a, b: frozenset((a["name"], b["name"])) in played
+    pairs = []
+    while len(pending) > 1:
+        p = pending.pop()
+        for i in range(len(pending) - 1, -1, -1):
+            if not met(p, pending[i]):
+                pairs.append((p, pending.pop(i)))
+                break
+        else:
+            q = pending.pop()
+            pairs.append(_swap(pairs, p, q, met) or (p, q))
+    for p, q in pairs:
+        yield game(p, q)
+
+
+# Split the latest pair (a, b) such that p and q can play a and b without a rematch, the
+# pair is replaced in place and the other new pair returned. None if there is no such pair.
+def _swap(pairs: list, p: dict, q: dict, met):
+    for j in range(len(pairs) - 1, -1, -1):
+        a, b = pairs[j]
+        for x, y in ((a, b), (b, a)):
+            if not met(x, p) and not met(y, q):
+                pairs[j] = (x, p)
+                return y, q
+    return None
+
+
+# Lowest ranked player that has not had a bye yet, for an odd count of Swiss players
+def swiss_bye(players: list, byes: list):
+    if len(players) % 2 == 0:
+        return None
+    for p in sorted(players, key=lambda p: p["score"]):
+        if p["name"] not in byes:
+            return p
+    return min(players, key=lambda p: p["score"])
+
+
+# Players dealt round the groups in seed order, so the top seeds land in different groups
+def groups(players: list, size: int) -> list:
+    count = max(1, math.ceil(len(players) / size))
+    return [players[i::count] for i in range(count)]
+
+
+def group_rounds(players: list, size: int) -> int:
+    return max((round_robin_rounds(len(g)) for g in groups(players, size)), default=0)
+
+
+def group_round_size(players: list, size: int, index: int) -> int:
+    return sum(round_robin_size(len(g)) for g in groups(players, size) if index < round_robin_rounds(len(g)))
+
+
+# Round `index` of every group's round robin
+def group_stage(players: list, size: int, index: int):
+    for g in groups(players, size):
+        if index < round_robin_rounds(len(g)):
+            yield from round_robin(g, index)
+
+
+# Best `advance` players of each group
+def group_qualifiers(players: list, size: int, advance: int) -> list:
+    qualified = []
+    for g in groups(players, size):
+        qualified.extend(sorted(g, key=lambda p: -p["score"])[:advance])
+    return qualified
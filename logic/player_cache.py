@@ -0,0 +1,105 @@
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Compiled players kept at most, and the approximate memory they may take, in bytes
+MAX_PLAYERS = 256
+MAX_PLAYER_BYTES = 16 * 1024 * 1024
+# Bytes of base64 player code kept by content hash
+MAX_CODE_BYTES = 16 * 1024 * 1024
+
+
+# A player's code compiled once and loaded in its own namespace
+class CompiledPlayer:
+    __slots__ = ('digest', 'code', 'play', 'size')
+
+    def __init__(self, digest: str, code, play, size: int):
+        self.digest = digest
+        self.code = code
+        self.play = play
+        self.size = size
+
+
+# Compiled player code shared by every game running on a node, keyed by the hash of the
+# base64 source so the same bot is decoded and compiled once however many games it plays.
+# Least recently used players are evicted past max_players or max_bytes. The base64 sources
+# themselves are kept by the same hash, for nodes that get games with code hashes only.
+class PlayerCache:
+    def __init__(self, max_players: int = MAX_PLAYERS, max_bytes: int = MAX_PLAYER_BYTES,
+                 max_code_bytes: int = MAX_CODE_BYTES):
+        self.max_players = max_players
+        self.max_bytes = max_bytes
+        self.max_code_bytes = max_code_bytes
+        self.players = OrderedDict()  # digest -> CompiledPlayer
+        self.bytes = 0
+        self.codes = OrderedDict()  # digest -> base64 code
+        self.code_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(code: str) -> str:
+        return hashlib.sha256(code.encode()).hexdigest()
+
+    # Compiled player for base64 encoded code, compiling and loading it on a miss
+    def get(self, code: str) -> CompiledPlayer:
+        digest = self.digest(code)
+        with self.lock:
+            player = self.players.get(digest)
+            if player is not None:
+                self.players.move_to_end(digest)
+                self.hits += 1
+                return player
+            self.misses += 1
+
+        source = base64.b64decode(code).decode("utf-8")
+        compiled = compile(source, f'<player {digest[:12]}>', 'exec')
+        namespace = {}
+        exec(compiled, namespace)
+        player = CompiledPlayer(digest, compiled, namespace.get('play'), len(source) + len(compiled.co_code))
+
+        with self.lock:
+            # Another game may have compiled the same player meanwhile
+            if digest in self.players:
+                return self.players[digest]
+            self.players[digest] = player
+            self.bytes += player.size
+            while len(self.players) > 1 and (len(self.players) > self.max_players or self.bytes > self.max_bytes):
+                _, evicted = self.players.popitem(last=False)
+                self.bytes -= evicted.size
+        return player
+
+    # The play callable of base64 encoded code, None if the code does not define one
+    def get_play(self, code: str):
+        return self.get(code).play
+
+    # Keep base64 code under its hash, returns the hash
+    def put_code(self, code: str) -> str:
+        digest = self.digest(code)
+        with self.lock:
+            if digest in self.codes:
+                self.codes.move_to_end(digest)
+                return digest
+            self.codes[digest] = code
+            self.code_bytes += len(code)
+            while len(self.codes) > 1 and self.code_bytes > self.max_code_bytes:
+                _, evicted = self.codes.popitem(last=False)
+                self.code_bytes -= len(evicted)
+        return digest
+
+    # Base64 code of a hash, None if it is not kept
+    def get_code(self, digest: str):
+        with self.lock:
+            code = self.codes.get(digest)
+            if code is not None:
+                self.codes.move_to_end(digest)
+            return code
+
+    def clear(self):
+        with self.lock:
+            self.players.clear()
+            self.codes.clear()
+            self.bytes = 0
+            self.code_bytes = 0
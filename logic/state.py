@@ -0,0 +1,136 @@
+from array import array
+
+# Player fields kept as attributes, any other field is carried along untouched
+PLAYER_FIELDS = ('name', 'score', 'code_hash', 'active', 'next_round')
+
+
+class PlayerRecord:
+    __slots__ = PLAYER_FIELDS + ('extra',)
+
+    def __init__(self, name, score=0, code_hash=None, active=True, next_round=False, extra=None):
+        self.name = name
+        self.score = score
+        self.code_hash = code_hash  # Hash the player's code is stored under
+        self.active = active
+        self.next_round = next_round
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, player: dict) -> 'PlayerRecord':
+        extra = {k: v for k, v in player.items() if k not in PLAYER_FIELDS} or None
+        return cls(player['name'], player.get('score', 0), player.get('code_hash'), player.get('active', True),
+                   player.get('next_round', False), extra)
+
+    def to_dict(self) -> dict:
+        player = {'name': self.name, 'score': self.score, 'code_hash': self.code_hash, 'active': self.active,
+                  'next_round': self.next_round}
+        if self.extra:
+            player.update(self.extra)
+        return player
+
+
+# Tournament document held as players indexed by name, a set of the (round, pair) already
+# decided and results in parallel arrays of player indexes, so recording a result costs the
+# same whatever the size of the tournament. to_dict gives back the stored JSON shape, results
+# only: what readers show of them is derived where they are shown. Documents of the old
+# shape, with a 'history' of 'winner-loser-round' keys instead, are read too.
+class TournamentState:
+    def __init__(self, meta: dict, players: list, results=()):
+        self.meta = meta  # Every other field of the document
+        self.players = players
+        self.index = {p.name: i for i, p in enumerate(players)}
+        self.rounds = array('I')
+        self.winners = array('I')
+        self.losers = array('I')
+        self.draws = array('B')
+        self.history = set()  # (round, index, index) of every decided pair, lowest index first
+        for result in results:
+            self._append(*result)
+
+    @classmethod
+    def from_dict(cls, tournament: dict) -> 'TournamentState':
+        meta = {k: v for k, v in tournament.items() if k not in ('players', 'results', 'games', 'history')}
+        state = cls(meta, [PlayerRecord.from_dict(p) for p in tournament.get('players', [])])
+        if 'results' in tournament:
+            for round, winner, loser, draw in tournament['results']:
+                state._append(round, winner, loser, draw)
+        else:
+            for key in tournament.get('history', []):
+                state._append(*state._parse_history(key), False)
+        return state
+
+    # 'winner-loser-round' keys of documents written before results were kept
+    def _parse_history(self, key: str):
+        names, round = key.rsplit('-', 1)
+        for i in range(len(names)):
+            if names[i] == '-' and names[:i] in self.index and names[i + 1:] in self.index:
+                return int(round), names[:i], names[i + 1:]
+        raise ValueError(f'cannot parse history entry {key}')
+
+    def _append(self, round: int, winner: str, loser: str, draw) -> bool:
+        w, l = self.index[winner], self.index[loser]
+        key = (round, w, l) if w < l else (round, l, w)
+        if key in self.history:
+            return False
+        self.history.add(key)
+        self.rounds.append(round)
+        self.winners.append(w)
+        self.losers.append(l)
+        self.draws.append(1 if draw else 0)
+        return True
+
+    def __len__(self):
+        return len(self.players)
+
+    def player(self, name: str) -> PlayerRecord:
+        return self.players[self.index[name]]
+
+    @property
+    def round(self):
+        return self.meta.get('round')
+
+    @property
+    def temp(self):
+        return self.meta.get('temp', 0)
+
+    # Record a game result of the current round ({'winner': {name: score}, 'l': {name: score},
+    # 'draw', 'round'}), False if that pair already has a result this round or the result is
+    # a late copy of a game of an earlier round
+    def record(self, data: dict) -> bool:
+        winner_name, winner_score = next(iter(data['winner'].items()))
+        loser_name, loser_score = next(iter(data['l'].items()))
+        draw = data.get('draw', False)
+        if data.get('round', self.round) != self.round:
+            return False
+        if not self._append(self.round, winner_name, loser_name, draw):
+            return False
+
+        # A draw is worth half a win to each player
+        score = winner_score + (0.5 if draw else 1)
+        winner = self.player(winner_name)
+        if winner.score < score:
+            winner.score = score
+            winner.next_round = True
+            winner.active = False
+        loser = self.player(loser_name)
+        loser.score = max(loser.score, loser_score + (0.5 if draw else 0))
+        loser.active = False
+        loser.next_round = False
+        self.meta['temp'] = self.temp - 1
+        return True
+
+    # Pairs of names that have met, for pairings that avoid rematches
+    def played(self) -> set:
+        names = [p.name for p in self.players]
+        return {frozenset((names[w], names[l])) for w, l in zip(self.winners, self.losers)}
+
+    def results(self):
+        names = [p.name for p in self.players]
+        for round, w, l, draw in zip(self.rounds, self.winners, self.losers, self.draws):
+            yield round, names[w], names[l], bool(draw)
+
+    def to_dict(self) -> dict:
+        tournament = dict(self.meta)
+        tournament['players'] = [p.to_dict() for p in self.players]
+        tournament['results'] = [list(r) for r in self.results()]
+        return tournament
@@ -1,36 +1,23 @@
-import threading
-import time
+import copy
 import random
 import logging
-from chord.node_reference import ChordNodeReference
-import base64
+from . import pairing
+from .games import get_game
+from .player_cache import PlayerCache
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s')
 
+# Code of the players whose games run on this node, by hash
+player_cache = PlayerCache()
+# Games a match is made of unless the tournament sets 'best_of'
+BEST_OF = 1
+# Group stage defaults: players per group and how many of each go through to the knockout
+GROUP_SIZE = 4
+GROUP_ADVANCE = 2
+
 
-def get_winner(result1, result2):
-    if result1 == 'rock' and result2 == 'paper':
-        return 1
-    if result1 == 'rock' and result2 == 'scissor':
-        return 0
-    if result1 == 'rock' and result2 == 'rock':
-        return 1  # ???
-
-    if result1 == 'paper' and result2 == 'scissor':
-        return 1
-    if result1 == 'paper' and result2 == 'rock':
-        return 0
-    if result1 == 'paper' and result2 == 'paper':
-        return 1
-
-    if result1 == 'scissor' and result2 == 'scissor':
-        return 1
-    if result1 == 'scissor' and result2 == 'rock':
-        return 1
-    if result1 == 'scissor' and result2 == 'paper':
-        return 0
 class TournamentSimulator:
     @staticmethod
-    def generate_games(players, tournament_type="elimination"):
+    def generate_games(players, tournament_type="elimination", rng=random):
         games = []
 
         if tournament_type == "elimination":
@@ -56,57 +43,153 @@ class TournamentSimulator:
                 for player in active_players:
                     player["active"] = True
 
-            random.shuffle(active_players)
+            rng.shuffle(active_players)
             while len(active_players) > 1:
                 p1 = active_players.pop()
                 p2 = active_players.pop()
-                game_info = {
-                    "player1": {p1["name"]: p1["score"]},
-                    "player2": {p2["name"]: p2["score"]}
-                }
-                games.append(game_info)
+                games.append(pairing.game(p1, p2))
 
         return games
 
+    # Number of games and a stream of the games of the tournament's next round, None once
+    # it is over. Advances the round counter, records byes and the seed the round was drawn
+    # with ('round_seed'), the same seed draws the same round again.
+    @staticmethod
+    def next_round(tournament, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        players = tournament['players']
+        ttype = tournament.get('type', 'elimination')
+        index = tournament.get('round', 0)  # Rounds played so far
+        if ttype == 'round_robin':
+            if index >= pairing.round_robin_rounds(len(players)):
+                return None
+            size, games = pairing.round_robin_size(len(players)), pairing.round_robin(players, index)
+        elif ttype == 'swiss':
+            if index >= int(tournament.get('rounds') or pairing.swiss_rounds(len(players))):
+                return None
+            byes = tournament.setdefault('byes', [])
+            bye = pairing.swiss_bye(players, byes)
+            if bye:
+                byes.append(bye['name'])
+                bye['score'] += 1
+            played = {frozenset((w, l)) for _, w, l, _ in tournament.get('results', [])}
+            size, games = len(players) // 2, pairing.swiss(players, played, bye)
+        elif ttype == 'group_stage' and tournament.get('stage') != 'knockout':
+            group_size = int(tournament.get('group_size') or GROUP_SIZE)
+            if index < pairing.group_rounds(players, group_size):
+                size = pairing.group_round_size(players, group_size, index)
+                games = pairing.group_stage(players, group_size, index)
+            else:
+                qualified = pairing.group_qualifiers(players, group_size,
+                                                     int(tournament.get('advance') or GROUP_ADVANCE))
+                names = {p['name'] for p in qualified}
+                for player in players:
+                    player['active'] = player['name'] in names
+                    player['next_round'] = False
+                tournament['stage'] = 'knockout'
+                return TournamentSimulator.next_round(tournament, seed)
+        else:
+            games = TournamentSimulator.generate_games(players, 'elimination', random.Random(seed))
+            if not games:
+                return None
+            size = len(games)
+        tournament['round'] = index + 1
+        tournament['round_seed'] = seed
+        return size, games
+
+    # Stream of the games of the tournament's current round still without a result, for a node
+    # taking the round over. The round is drawn again with its seed from the players as they
+    # were when it started, the round's results taken back from a copy of them.
+    @staticmethod
+    def round_games(tournament):
+        round = tournament['round']
+        start = copy.deepcopy({k: v for k, v in tournament.items() if k not in ('games', 'history')})
+        start['round'] = round - 1
+        start['results'] = [result for result in tournament.get('results', []) if result[0] != round]
+        players = {player['name']: player for player in start['players']}
+        # A knockout round was drawn from the players still active, or else from the winners
+        # of the previous round. Players of the games still out keep the flags they started with.
+        active = any(player.get('active', True) for player in start['players'])
+        decided = set()
+        for result_round, winner, loser, draw in tournament.get('results', []):
+            if result_round != round:
+                continue
+            decided.add(frozenset((winner, loser)))
+            players[winner]['score'] -= 0.5 if draw else 1
+            players[loser]['score'] -= 0.5 if draw else 0
+            for name in (winner, loser):
+                players[name]['active'] = active
+                players[name]['next_round'] = not active
+        if start.get('type') == 'swiss' and len(players) % 2 and start.get('byes'):
+            players[start['byes'].pop()]['score'] -= 1
+        _, games = TournamentSimulator.next_round(start, tournament.get('round_seed'))
+        return (game for game in games if frozenset((*game['player1'], *game['player2'])) not in decided)
+
+    # Name of the tournament's winner once it is over: the last player standing of a
+    # knockout, the best score otherwise
+    @staticmethod
+    def winner(tournament):
+        players = tournament['players']
+        if tournament.get('type', 'elimination') in ('elimination', 'group_stage'):
+            for player in players:
+                if player.get('next_round', False):
+                    return player['name']
+            # A knockout of a single player
+            remaining = [p for p in players if p.get('active', True)]
+            return remaining[0]['name'] if len(remaining) == 1 else None
+        if not players:
+            return None
+        return max(players, key=lambda p: p['score'])['name']
+
+    # Key of a game of the tournament's current round, the same on every node
+    @staticmethod
+    def game_key(tournament, players) -> str:
+        names = [list(players[p].keys())[0] for p in ('player1', 'player2')]
+        return f"{tournament['name']}-{names[0]}-{names[1]}-{tournament.get('round')}"
+
+    # Code of both players of a game from the local cache, None for code that is not there. An
+    # empty program is code too, its player forfeits.
     @staticmethod
-    def simulate_game(tournament, players, node):
-        logging.info(f'SIMULATING GAME {players} ({tournament['name']})')
+    def game_codes(players):
+        return [player_cache.get_code(digest) if digest else None for digest in players.get('codes', ())]
+
+    # Game played, games of each match and whether a match needs a winner: every knockout
+    # match does, the ones of a group stage's knockout stage included
+    @staticmethod
+    def match_options(tournament) -> dict:
+        return {'game': get_game(tournament.get('game')).name,
+                'games': int(tournament.get('best_of') or BEST_OF),
+                'decisive': tournament.get('type', 'elimination') == 'elimination'
+                or tournament.get('stage') == 'knockout'}
+
+    # Relative CPU cost of one match of a tournament
+    @staticmethod
+    def match_cost(tournament) -> float:
+        options = TournamentSimulator.match_options(tournament)
+        return get_game(options['game']).cost * options['games']
+
+    # Decide a match from its result, a player that failed to answer loses it
+    @staticmethod
+    def finish_game(tournament, players, result, node):
+        logging.info(f'FINISHING GAME {players} ({tournament['name']}): {result}')
         player1 = players['player1']
         player2 = players['player2']
-        player1_code = ''
-        player2_code = ''
-        for p in tournament['players']:
-            if p['name'] == list(player1.keys())[0]:
-                player1_code = p['code']
-            elif p['name'] == list(player2.keys())[0]:
-                player2_code = p['code']
-
-        decoded_code_1 = base64.b64decode(player1_code).decode("utf-8")
-        decoded_code_2 = base64.b64decode(player2_code).decode("utf-8")
-        player1_result = ''
-        player2_result = ''
-
-        namespace1 = {}
-        exec(decoded_code_1, namespace1)
-
-        if "play" in namespace1:
-            result = namespace1["play"]()
-            player1_result = result
-
-        namespace2 = {}
-        exec(decoded_code_2, namespace2)
-
-        if "play" in namespace2:
-            result = namespace2["play"]()
-            player2_result = result
-        winner = get_winner(player1_result, player2_result)
+        draw = False
+        if result.get('failed') is not None:
+            winner = 1 - result['failed']
+        else:
+            wins = result['wins']
+            winner = 0 if wins[0] >= wins[1] else 1
+            draw = wins[0] == wins[1]
         if winner == 0:
             players = [player1, player2]
         else:
             players = [player2, player1]
 
         logging.info(f'WINNER {players[0]}')
-        time.sleep(5)
-        node.update_tournament_sim(name=tournament['name'], data={'winner': players[0], 'l': players[1]})
+        node.update_tournament_sim(name=tournament['name'], data={
+            'winner': players[0], 'l': players[1], 'draw': draw, 'round': tournament.get('round'),
+            'key': TournamentSimulator.game_key(tournament, {'player1': player1, 'player2': player2}),
+            'wins': result.get('wins'), 'draws': result.get('draws', 0)})
         return players
-
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages are imported from the repository root, as the node and the front end run
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,80 @@
+import pytest
+
+from chord import codec
+from chord.codec import JsonCodec, MsgpackCodec, get_codec, codec_by_name
+
+VALUES = [
+    None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32, 2 ** 63, -1, -32, -33, -128, -129,
+    -32768, -32769, -2 ** 31, -2 ** 31 - 1, -2 ** 63, 0.5, -1e300, '', 'a' * 31, 'a' * 32, 'é' * 300,
+    'x' * 70000, [], list(range(15)), list(range(16)), list(range(70000)), {}, {f'k{i}': i for i in range(15)},
+    {f'k{i}': i for i in range(16)}, {'nested': [{'a': [1, None, 'b']}, {'c': {'d': 2.25}}]}, {1: 'int key'},
+]
+
+TOURNAMENT = {
+    'type': 'swiss', 'round': 3, 'temp': 4, 'completed': False, 'winner': None,
+    'players': [{'name': f'p{i}', 'score': i / 2, 'code_hash': 'ab' * 32, 'active': True, 'next_round': False}
+                for i in range(9)],
+    'results': [[1, 'p0', 'p1', False], [2, 'p2', 'p3', True]],
+}
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_pure_python_msgpack_round_trip(value, monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    assert MsgpackCodec.decode(MsgpackCodec.encode(value)) == value
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_pure_python_msgpack_matches_msgpack(value, monkeypatch):
+    msgpack = pytest.importorskip('msgpack')
+    expected = msgpack.packb(value, use_bin_type=True)
+    monkeypatch.setattr(codec, 'msgpack', None)
+    assert MsgpackCodec.encode(value) == expected
+    assert MsgpackCodec.decode(expected) == value
+
+
+def test_tuples_decode_as_lists(monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    assert MsgpackCodec.decode(MsgpackCodec.encode((1, (2, 3)))) == [1, [2, 3]]
+
+
+def test_bytes_round_trip(monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    for size in (0, 255, 256, 70000):
+        data = bytes(range(256)) * (size // 256) + bytes(size % 256)
+        assert MsgpackCodec.decode(MsgpackCodec.encode(data)) == data
+
+
+@pytest.mark.parametrize('chosen', [JsonCodec, MsgpackCodec])
+def test_tournament_round_trip(chosen):
+    assert chosen.decode(chosen.encode(TOURNAMENT)) == TOURNAMENT
+
+
+def test_empty_payload_decodes_to_none():
+    assert JsonCodec.decode(b'') is None
+    assert MsgpackCodec.decode(b'') is None
+
+
+def test_unencodable_value_raises(monkeypatch):
+    monkeypatch.setattr(codec, 'msgpack', None)
+    with pytest.raises(TypeError):
+        MsgpackCodec.encode({1, 2})
+    with pytest.raises(ValueError):
+        MsgpackCodec.encode(2 ** 64)
+
+
+def test_codec_lookup():
+    assert get_codec(JsonCodec.id) is JsonCodec
+    assert get_codec(MsgpackCodec.id) is MsgpackCodec
+    assert codec_by_name('msgpack') is MsgpackCodec
+    with pytest.raises(ValueError):
+        get_codec(99)
+    with pytest.raises(ValueError):
+        codec_by_name('xml')
+
+
+def test_binary_codec_is_default_only_with_the_c_extension(monkeypatch):
+    monkeypatch.setattr(codec, 'MSGPACK_C', False)
+    assert codec.default_codec() is JsonCodec
+    monkeypatch.setattr(codec, 'MSGPACK_C', True)
+    assert codec.default_codec() is MsgpackCodec
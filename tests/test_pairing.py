@@ -0,0 +1,93 @@
+import random
+from collections import Counter
+
+import pytest
+
+from logic import pairing
+from logic.state import TournamentState
+from logic.tournament import TournamentSimulator
+
+
+def players(count: int) -> list:
+    return [{'name': f'p{i}', 'score': 0, 'code_hash': None} for i in range(count)]
+
+
+def names(game: dict) -> frozenset:
+    return frozenset((*game['player1'], *game['player2']))
+
+
+# Play a tournament through with random results, returns the pairs of each round
+def play(tournament_type: str, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    tournament = {'name': 't', 'type': tournament_type, 'players': players(count), 'results': []}
+    rounds = []
+    while (plan := TournamentSimulator.next_round(tournament)) is not None:
+        size, games = plan
+        games = list(games)
+        assert len(games) == size
+        rounds.append([names(game) for game in games])
+        state = TournamentState.from_dict(dict(tournament, temp=size))
+        for game in games:
+            winner, loser = (game['player1'], game['player2']) if rng.random() < 0.5 else (game['player2'], game['player1'])
+            assert state.record({'winner': winner, 'l': loser, 'round': state.round})
+        tournament = state.to_dict()
+    return rounds
+
+
+@pytest.mark.parametrize('count', [2, 3, 4, 7, 8, 15, 16, 33])
+def test_round_robin_every_pair_meets_once(count):
+    rounds = play('round_robin', count)
+    assert len(rounds) == pairing.round_robin_rounds(count)
+    pairs = Counter(pair for games in rounds for pair in games)
+    assert len(pairs) == count * (count - 1) // 2
+    assert set(pairs.values()) == {1}
+
+
+@pytest.mark.parametrize('count', [4, 7, 16, 33])
+def test_round_robin_players_play_once_per_round(count):
+    for games in play('round_robin', count):
+        seen = [name for pair in games for name in pair]
+        assert len(seen) == len(set(seen))
+        assert len(games) == pairing.round_robin_size(count)
+
+
+@pytest.mark.parametrize('count', [2, 5, 8, 13, 16, 31, 64])
+@pytest.mark.parametrize('seed', range(5))
+def test_swiss_has_no_rematches(count, seed):
+    rounds = play('swiss', count, seed)
+    assert len(rounds) == pairing.swiss_rounds(count)
+    pairs = [pair for games in rounds for pair in games]
+    assert len(pairs) == len(set(pairs))
+    for games in rounds:
+        seen = [name for pair in games for name in pair]
+        assert len(seen) == len(set(seen)) == count - count % 2
+
+
+def test_swiss_byes_go_to_different_players():
+    tournament = {'type': 'swiss', 'players': players(7), 'results': []}
+    byes = []
+    for _ in range(3):
+        TournamentSimulator.next_round(tournament)
+        byes.append(tournament['byes'][-1])
+    assert len(set(byes)) == 3
+
+
+def test_group_stage_groups_play_round_robins():
+    groups = pairing.groups(players(10), 4)
+    assert sorted(len(group) for group in groups) == [3, 3, 4]
+    group_of = {player['name']: i for i, group in enumerate(groups) for player in group}
+    rounds = [list(pairing.group_stage(players(10), 4, index)) for index in range(pairing.group_rounds(players(10), 4))]
+    pairs = Counter(names(game) for games in rounds for game in games)
+    assert set(pairs.values()) == {1}
+    assert all(len({group_of[name] for name in pair}) == 1 for pair in pairs)
+    assert len(pairs) == 3 + 3 + 6
+
+
+@pytest.mark.parametrize('count', [2, 5, 8, 13])
+def test_elimination_halves_the_field(count):
+    rounds = play('elimination', count)
+    remaining = count
+    for games in rounds:
+        assert len(games) == remaining // 2
+        remaining -= len(games)
+    assert remaining == 1
@@ -0,0 +1,156 @@
+import time
+
+from chord.scheduler import GameScheduler, QUEUE_PER_WORKER
+
+GROUP = 't-1'
+
+
+def load(workers: int = 2, running: int = 0, queued: int = 0, cost: float = 0.0) -> dict:
+    return {'workers': workers, 'running': running, 'queued': queued, 'cost': cost}
+
+
+def add_games(scheduler: GameScheduler, count: int) -> list:
+    keys = [f'g{i}' for i in range(count)]
+    for key in keys:
+        scheduler.add(GROUP, key, {'key': key})
+    return keys
+
+
+def placed(batches: dict) -> dict:
+    return {node_id: [key for key, _ in games] for node_id, (_, games) in batches.items()}
+
+
+def test_games_go_to_the_nodes_with_free_workers():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load(workers=4)), 2: ('b', load(workers=4, running=4, queued=8))})
+    add_games(scheduler, 6)
+    batches = placed(scheduler.schedule(GROUP))
+    assert list(batches) == [1]
+    assert len(batches[1]) == 6
+
+
+def test_placement_spreads_over_equal_nodes_and_stops_at_capacity():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load()), 2: ('b', load())})
+    keys = add_games(scheduler, 20)
+    capacity = 2 * 2 * (1 + QUEUE_PER_WORKER)
+    assert scheduler.capacity() == capacity
+    batches = placed(scheduler.schedule(GROUP))
+    assert sorted(len(games) for games in batches.values()) == [capacity // 2] * 2
+    assert scheduler.capacity() == 0
+    assert scheduler.pending(GROUP)
+    sent = [key for games in batches.values() for key in games]
+    assert len(set(sent)) == len(sent) and set(sent) <= set(keys)
+
+
+def test_cheaper_node_wins_a_tie():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load(cost=5)), 2: ('b', load(cost=1))})
+    add_games(scheduler, 1)
+    assert list(placed(scheduler.schedule(GROUP))) == [2]
+
+
+def test_a_finished_game_frees_its_slot():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load(workers=1))})
+    add_games(scheduler, 1 + QUEUE_PER_WORKER)
+    scheduler.schedule(GROUP)
+    assert scheduler.capacity() == 0
+    assert scheduler.finished(GROUP, 'g0') == ['a']
+    assert scheduler.capacity() == 1
+    assert scheduler.finished(GROUP, 'g0') == []
+
+
+def test_rejected_games_are_sent_again_elsewhere():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load(workers=1))})
+    add_games(scheduler, 2)
+    scheduler.schedule(GROUP)
+    scheduler.rejected(GROUP, ['g0', 'g1'], 1)
+    assert scheduler.capacity() == 0
+    scheduler.refresh({1: ('a', load(workers=1, running=1, queued=2)), 2: ('b', load(workers=1))})
+    assert placed(scheduler.schedule(GROUP)) == {2: ['g0', 'g1']}
+
+
+def test_a_node_is_dropped_after_missing_several_polls():
+    scheduler = GameScheduler(max_misses=3)
+    scheduler.refresh({1: ('a', load()), 2: ('b', load())})
+    add_games(scheduler, 2)
+    lost = placed(scheduler.schedule(GROUP))[1]
+    for _ in range(2):
+        scheduler.refresh({1: ('a', None), 2: ('b', load())})
+        assert 1 in scheduler.loads
+        assert not scheduler.pending(GROUP)
+    scheduler.refresh({2: ('b', load())})
+    assert 1 not in scheduler.loads
+    assert scheduler.recovered == len(lost)
+    assert placed(scheduler.schedule(GROUP)) == {2: lost}
+
+
+def test_an_answer_resets_the_missed_polls():
+    scheduler = GameScheduler(max_misses=2)
+    scheduler.refresh({1: ('a', load())})
+    for _ in range(3):
+        scheduler.refresh({1: ('a', None)})
+        scheduler.refresh({1: ('a', load())})
+    assert 1 in scheduler.loads
+
+
+def test_lost_games_of_a_group_without_a_queue_are_requeued():
+    scheduler = GameScheduler(max_misses=1)
+    scheduler.refresh({1: ('a', load())})
+    scheduler.add(GROUP, 'g0', {}, {'node': 1, 'deadline': time.time() + 60})
+    assert GROUP not in scheduler.waiting
+    scheduler.refresh({})
+    assert scheduler.pending(GROUP)
+
+
+def test_expired_leases_are_sent_to_another_node():
+    scheduler = GameScheduler(lease_time=0)
+    scheduler.refresh({1: ('a', load(workers=1))})
+    add_games(scheduler, 1)
+    assert placed(scheduler.schedule(GROUP)) == {1: ['g0']}
+    scheduler.refresh({1: ('a', load(workers=1)), 2: ('b', load(workers=1))})
+    time.sleep(0.01)
+    assert placed(scheduler.schedule(GROUP)) == {2: ['g0']}
+    assert scheduler.expired == 1
+
+
+def test_checkpoints_renew_the_lease_and_travel_with_the_game():
+    scheduler = GameScheduler(lease_time=60)
+    scheduler.refresh({1: ('a', load(workers=1))})
+    add_games(scheduler, 1)
+    scheduler.schedule(GROUP)
+    assert scheduler.checkpoint(GROUP, 'g0', {'played': 3, 'wins': [2, 1], 'draws': 0})
+    lease = scheduler.leases(GROUP)['g0']
+    assert lease['node'] == 1 and lease['checkpoint']['played'] == 3 and lease['deadline'] > time.time()
+
+    taken_over = GameScheduler()
+    taken_over.refresh({2: ('b', load(workers=1))})
+    taken_over.add(GROUP, 'g0', {'key': 'g0'}, dict(lease, deadline=time.time() - 1))
+    (node, games), = taken_over.schedule(GROUP).values()
+    assert games[0][1]['checkpoint']['played'] == 3
+
+
+def test_queued_games_are_stolen_for_idle_nodes():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load(workers=1)), 2: ('b', load(workers=2, running=2, queued=4))})
+    add_games(scheduler, 1 + QUEUE_PER_WORKER)
+    assert placed(scheduler.schedule(GROUP)) == {1: ['g0', 'g1', 'g2']}
+    assert scheduler.steal_plan(GROUP) == []
+    scheduler.refresh({1: ('a', load(workers=1, running=1, queued=2)), 2: ('b', load(workers=2))})
+    assert scheduler.steal_plan(GROUP) == [(1, 'a', 2)]
+    scheduler.released(GROUP, ['g1', 'g2'], 1)
+    assert scheduler.stolen == 2
+    assert placed(scheduler.schedule(GROUP)) == {2: ['g1', 'g2']}
+
+
+def test_done_once_every_result_is_in():
+    scheduler = GameScheduler()
+    scheduler.refresh({1: ('a', load())})
+    keys = add_games(scheduler, 3)
+    scheduler.schedule(GROUP)
+    for key in keys:
+        assert not scheduler.done(GROUP)
+        scheduler.finished(GROUP, key)
+    assert scheduler.done(GROUP)
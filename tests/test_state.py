@@ -0,0 +1,81 @@
+from logic.state import TournamentState
+
+
+def tournament() -> dict:
+    return {
+        'name': 't', 'type': 'round_robin', 'round': 1, 'temp': 2, 'best_of': 3, 'completed': False,
+        'players': [{'name': 'ann', 'score': 0, 'code_hash': 'a' * 64, 'active': True, 'next_round': False},
+                    {'name': 'bob', 'score': 0, 'code_hash': 'b' * 64, 'active': True, 'next_round': False,
+                     'seed': 4},
+                    {'name': 'cy', 'score': 0, 'code_hash': None, 'active': True, 'next_round': False},
+                    {'name': 'dee', 'score': 0, 'code_hash': None, 'active': True, 'next_round': False}],
+        'results': [],
+    }
+
+
+def result(winner: str, loser: str, round: int = 1, draw: bool = False, scores=(0, 0)) -> dict:
+    return {'winner': {winner: scores[0]}, 'l': {loser: scores[1]}, 'draw': draw, 'round': round}
+
+
+def test_round_trip_keeps_the_document():
+    document = tournament()
+    assert TournamentState.from_dict(document).to_dict() == document
+
+
+def test_record_updates_scores_and_flags():
+    state = TournamentState.from_dict(tournament())
+    assert state.record(result('ann', 'bob'))
+    assert state.record(result('cy', 'dee', draw=True))
+    ann, bob, cy, dee = (state.player(name) for name in ('ann', 'bob', 'cy', 'dee'))
+    assert (ann.score, ann.next_round, ann.active) == (1, True, False)
+    assert (bob.score, bob.next_round, bob.active) == (0, False, False)
+    assert cy.score == dee.score == 0.5
+    assert state.temp == 0
+
+
+def test_record_refuses_a_second_result_of_a_pair():
+    state = TournamentState.from_dict(tournament())
+    assert state.record(result('ann', 'bob'))
+    assert not state.record(result('bob', 'ann'))
+    assert state.player('bob').score == 0
+    assert state.temp == 1
+
+
+def test_record_refuses_results_of_another_round():
+    state = TournamentState.from_dict(tournament())
+    assert not state.record(result('ann', 'bob', round=0))
+    assert state.temp == 2
+
+
+def test_recorded_results_survive_a_round_trip():
+    state = TournamentState.from_dict(tournament())
+    state.record(result('ann', 'bob'))
+    state.record(result('dee', 'cy', draw=True))
+    document = state.to_dict()
+    assert document['results'] == [[1, 'ann', 'bob', False], [1, 'dee', 'cy', True]]
+    assert 'games' not in document and 'history' not in document
+    assert document['players'][1]['seed'] == 4
+    again = TournamentState.from_dict(document)
+    assert again.to_dict() == document
+    assert again.played() == {frozenset(('ann', 'bob')), frozenset(('cy', 'dee'))}
+    assert not again.record(result('bob', 'ann'))
+
+
+def test_documents_with_history_are_read():
+    document = tournament()
+    del document['results']
+    document['games'] = ['ann vs bob']
+    document['history'] = ['ann-bob-1']
+    state = TournamentState.from_dict(document)
+    assert list(state.results()) == [(1, 'ann', 'bob', False)]
+    assert not state.record(result('ann', 'bob'))
+    assert 'games' not in state.to_dict() and 'history' not in state.to_dict()
+
+
+def test_history_of_hyphenated_names_is_parsed():
+    document = tournament()
+    document['players'][0]['name'] = 'a-n-n'
+    del document['results']
+    document['history'] = ['bob-a-n-n-1']
+    state = TournamentState.from_dict(document)
+    assert list(state.results()) == [(1, 'bob', 'a-n-n', False)]
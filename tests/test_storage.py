@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from chord.storage import KeyStore, DIGEST_BUCKETS
+from chord.utils import hash_function, _inbetween
+
+M = 8
+
+
+@pytest.fixture
+def store():
+    return KeyStore(M, {f'k{i}': {'value': i} for i in range(300)})
+
+
+def expected_keys(store, start, end):
+    return sorted(key for key in store.keys() if _inbetween(hash_function(key, M), start, end))
+
+
+def test_range_keys_match_a_scan(store):
+    rng = random.Random(1)
+    for _ in range(500):
+        start, end = rng.randrange(2 ** M), rng.randrange(2 ** M)
+        keys = store.range_keys(start, end)
+        assert sorted(keys) == expected_keys(store, start, end)
+
+
+def test_range_keys_are_clockwise_from_start(store):
+    keys = store.range_keys(200, 50)
+    distances = [(hash_function(key, M) - 200) % 2 ** M for key in keys]
+    assert distances == sorted(distances)
+
+
+def test_range_keys_of_equal_bounds_is_the_whole_ring(store):
+    assert sorted(store.range_keys(10, 10)) == sorted(store.keys())
+
+
+def test_first_key(store):
+    rng = random.Random(2)
+    for _ in range(200):
+        start, end = rng.randrange(2 ** M), rng.randrange(2 ** M)
+        keys = expected_keys(store, start, end)
+        first = store.first_key(start, end)
+        if not keys:
+            assert first is None
+        else:
+            distance = lambda key: (hash_function(key, M) - start - 1) % 2 ** M
+            assert distance(first) == min(map(distance, keys))
+
+
+def test_index_follows_deletes(store):
+    for i in range(0, 300, 3):
+        del store[f'k{i}']
+    store.pop('k1')
+    assert sorted(store.range_keys(0, 0)) == sorted(store.keys())
+    assert 'k1' not in store.range_items(0, 0)
+    assert len(store.hash_index) == len(store.key_index) == len(store)
+
+
+def test_digests_are_independent_of_write_order():
+    items = {f'k{i}': i for i in range(100)}
+    keys = list(items)
+    random.Random(3).shuffle(keys)
+    a = KeyStore(M)
+    b = KeyStore(M)
+    for key in items:
+        a.put(key, items[key], version=1)
+    for key in keys:
+        b.put(key, items[key], version=1)
+    assert a.digests == b.digests
+
+
+def test_digest_changes_only_in_the_bucket_of_the_key(store):
+    before = list(store.digests)
+    store['k7'] = 'new'
+    bucket = hash_function('k7', M) * DIGEST_BUCKETS >> M
+    changed = [i for i in range(DIGEST_BUCKETS) if store.digests[i] != before[i]]
+    assert changed == [bucket]
+    start, end = store.bucket_range(bucket)
+    assert _inbetween(hash_function('k7', M), start, end)
+
+
+def test_replica_converges_from_deltas(store):
+    replica = KeyStore(M)
+    replica.apply_delta(store.changes_since())
+    for i in range(50):
+        store[f'k{i}'] = 'changed'
+    for i in range(50, 80):
+        del store[f'k{i}']
+    store['new'] = 'added'
+    delta = store.changes_since(replica.synced_epoch, replica.synced_seq)
+    assert not delta['full']
+    assert len(delta['items']) == 51 and len(delta['deleted']) == 30
+    replica.apply_delta(delta)
+    assert replica.to_dict() == store.to_dict()
+    assert replica.digests == store.digests
+
+
+def test_replace_range_repairs_a_segment(store):
+    replica = KeyStore(M)
+    replica.apply_delta(store.changes_since())
+    start, end = store.bucket_range(3)
+    for key in store.range_keys(start, end):
+        store[key] = 'diverged'
+    replica.replace_range(start, end, store.range_snapshot(start, end))
+    assert replica.digests == store.digests
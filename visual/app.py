@@ -1,37 +1,84 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, Response, render_template, request, redirect, url_for, make_response, jsonify, \
+    stream_with_context
 import random
 import json
 import os
 from chord.node import ChordNode
 import socket
 import base64
+import time
 app = Flask(__name__)
 
-tournaments = []
+tournaments = {}  # name -> when it was created from this front end
 node = None
+# Seconds a tournament created here is shown before the catalog lists it
+CATALOG_DELAY = 10
 
 
 @app.route("/")
 def index():
-    _tournaments = node.get_tournaments()
-    _tournaments = json.loads(_tournaments) if len(_tournaments) else {}
+    status = request.args.get("status") or None
+    tournament_type = request.args.get("type") or None
+    cursor = request.args.get("after") or None
+    page = node.list_tournaments(status, tournament_type, cursor)
+    page = page or {'items': [], 'next': None, 'total': 0}
     _tournaments_to_render = {}
-    for key, value in _tournaments.items():
-        _tournaments_to_render[key] = {'data': {'completed': value}}
-    for t in tournaments:
-        if t not in _tournaments_to_render:
-            _tournaments_to_render[t] = {'data': {'completed': False}}
-    return render_template("index.html", tournaments=_tournaments_to_render)
+    if not (status or tournament_type or cursor):
+        # Newly created tournaments may not have reached the catalog yet
+        for t, created in sorted(tournaments.items(), key=lambda item: -item[1]):
+            if time.time() - created < CATALOG_DELAY:
+                _tournaments_to_render[t] = {'data': {'completed': False, 'status': 'open'}}
+    for item in page['items']:
+        _tournaments_to_render[item['name']] = {
+            'data': {'completed': item['status'] == 'completed', 'status': item['status'], 'type': item['type']}}
+    response = make_response(render_template("index.html", tournaments=_tournaments_to_render, total=page['total'],
+                                             next_cursor=page['next'], status=status,
+                                             tournament_type=tournament_type))
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app.route("/tournament/<tournament_name>")
 def tournament(tournament_name):
-    _tournament = node.get(tournament_name)
-    _tournament = json.loads(_tournament) if len(_tournament) > 0 else {}
-    _tournament_to_render = {'data': _tournament}
-    return render_template(
-        "tournament.html", tournament=_tournament_to_render, name=tournament_name
-    )
+    # Served from the node's cache until the tournament's owner says it changed
+    version, _tournament = node.get_cached(tournament_name)
+    if version and request.if_none_match.contains(version):
+        response = make_response("", 304)
+    else:
+        _tournament_to_render = {'data': _tournament}
+        games = [f'{winner} vs {loser}' + (' (draw)' if draw else '')
+                 for _, winner, loser, draw in _tournament.get('results', [])]
+        response = make_response(render_template(
+            "tournament.html", tournament=_tournament_to_render, games=games, name=tournament_name
+        ))
+    if version:
+        response.set_etag(version)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/tournament/<tournament_name>/events")
+def tournament_events(tournament_name):
+    # Resumes after the cursor of the last event received, see ChordNode.tournament_events
+    cursor = request.args.get("after") or request.headers.get("Last-Event-ID")
+    if request.accept_mimetypes.best != "text/event-stream":
+        # Long poll: the events after the cursor, as soon as there is one
+        return jsonify(node.tournament_events(tournament_name, cursor))
+
+    def stream(cursor):
+        while True:
+            page = node.tournament_events(tournament_name, cursor)
+            if page['reset']:
+                yield "event: reset\ndata: {}\n\n"
+            for seq, event in page['events']:
+                yield f"id: {page['epoch']}:{seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if not page['events']:
+                yield ": keepalive\n\n"
+            cursor = page['cursor']
+
+    return Response(stream_with_context(stream(cursor)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
 
 
 @app.route("/add_player/<tournament_name>", methods=["POST"])
@@ -40,10 +87,18 @@ def add_player(tournament_name):
     player_code = request.form['player_code']
     player_code_base64 = base64.b64encode(player_code.encode("utf-8")).decode("utf-8")
 
-    _tournament = node.get(tournament_name)
-    _tournament = json.loads(_tournament)
+    # Read from the owner, the whole document is written back
+    _tournament = node.get(tournament_name, for_update=True)
     if _tournament and not _tournament["completed"]:
-        _tournament['players'].append({"name": player_name, "score": 0, 'code': player_code_base64})
+        # The code is stored once by its hash, games carry the hash only
+        player = {"name": player_name, "score": 0}
+        code_hash = node.store_code(player_code_base64)
+        if code_hash:
+            player['code_hash'] = code_hash
+        else:
+            # Moved to the code store when the tournament starts
+            player['code'] = player_code_base64
+        _tournament['players'].append(player)
     node.send(tournament_name, _tournament)
     return redirect(url_for("tournament", tournament_name=tournament_name))
 
@@ -52,12 +107,17 @@ def add_player(tournament_name):
 def create_tournament():
     tournament_name = request.form["tournament_name"]
     tournament_type = request.form["tournament_type"]  # New field for type
+    best_of = int(request.form.get("best_of") or 1)
+    game = request.form.get("game") or "rps"
     if tournament_name not in tournaments:
-        tournaments.append(tournament_name)
+        tournaments[tournament_name] = time.time()
         new_tournament = {
             "type": tournament_type,
+            "created": tournaments[tournament_name],
+            "game": game,
+            "best_of": best_of,
             "players": [],
-            "games": [],
+            "results": [],
             "winner": None,
             "completed": False,
         }